@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+bench_build.py
+
+Time each stage of the gen_gtfs.py build on the real feed and on a scaled
+synthetic feed (synth_feed.py), and flag regressions against the committed
+baseline in bench_baseline.json:
+
+  - calendar:  expanding calendar_dates.txt (build_calendar_dates)
+  - flatten:   trips / stop_times flattening (build_tables without shapes)
+  - csv:       encoding the flattened tables as CSV
+  - archive:   the whole zip as gen_gtfs.py writes it, build_tables() then
+               write_archive() (default profile): flattening again, plus
+               shapes.txt streamed from shapes/*.geojson a shape at a time
+
+Each stage reports the best time of --repeat runs, its throughput in rows/s
+and its peak Python memory (tracemalloc, measured in a separate run so the
+tracing doesn't skew the timings). A stage is flagged when its time or
+peak memory is more than TOLERANCE over the baseline (and the time by more
+than MIN_DELTA_S, the memory by more than MIN_DELTA_MB). Baselines are only comparable on the machine they were
+recorded on; rerun with --update-baseline after an intended change or on a
+new machine.
+
+  usage: bench_build.py [--synthetic-stop-times N] [--synthetic-shapes N]
+                        [--repeat N] [--update-baseline]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from feed_archive import encode_tables, member_levels, write_archive
+from gen_gtfs import build_calendar_dates, build_tables, iter_shape_chunks, script_dir
+
+BASELINE = os.path.join(script_dir, "bench_baseline.json")
+TOLERANCE = 0.25
+# Timing noise floor: smaller slowdowns aren't flagged whatever the ratio
+MIN_DELTA_S = 0.05
+# Likewise for memory: peaks are rounded to 0.1 MB
+MIN_DELTA_MB = 1.0
+SYNTHETIC_STOP_TIMES = 100_000
+SYNTHETIC_SHAPES = 350
+
+
+def _stages(feed, tmpdir):
+    """(name, fn) for each build stage in order; fn() returns the rows it
+    handled. Later stages consume the state left by the earlier ones."""
+    state = {}
+    shape_ids = sorted({t["shape_id"] for t in feed["trips"] if "shape_id" in t})
+    shape_points = sum(map(len, iter_shape_chunks(shape_ids, feed["shapes_dir"])))
+
+    def flatten():
+        state["tables"] = build_tables(shapes=False, **feed)
+        return sum(len(rows) for rows in state["tables"].values())
+
+    def csv():
+        encode_tables(state["tables"])
+        return sum(len(rows) for rows in state["tables"].values())
+
+    def archive():
+        tables = build_tables(**feed)
+        write_archive(tables, f"{tmpdir}/feed.zip", member_levels(tables))
+        return sum(len(rows) for rows in state["tables"].values()) + shape_points
+
+    return [
+        ("calendar", lambda: len(build_calendar_dates())),
+        ("flatten", flatten),
+        ("csv", csv),
+        ("archive", archive),
+    ]
+
+
+def run(feed, repeat):
+    """{stage: {"seconds", "rows_per_s", "peak_mb"}} for one feed."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, fn in _stages(feed, tmpdir):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = fn()
+                best = min(best, time.perf_counter() - start)
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = {
+                "seconds": round(best, 4),
+                "rows_per_s": round(rows / best) if best else None,
+                "peak_mb": round(peak / 2**20, 1),
+            }
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """Messages for every stage over the baseline by more than tolerance."""
+    found = []
+    for dataset, stages in results.items():
+        for stage, r in stages.items():
+            base = baseline.get(dataset, {}).get(stage)
+            if not base:
+                continue
+            for key, unit, floor in (
+                ("seconds", "s", MIN_DELTA_S),
+                ("peak_mb", "MB", MIN_DELTA_MB),
+            ):
+                over = r[key] - base[key]
+                if base[key] and r[key] > base[key] * (1 + tolerance) and over > floor:
+                    found.append(
+                        f"{dataset} {stage}: {key} {r[key]:g}{unit} vs "
+                        f"baseline {base[key]}{unit} "
+                        f"(+{(r[key] / base[key] - 1) * 100:.0f}%)"
+                    )
+    return found
+
+
+def print_results(results):
+    for dataset, stages in results.items():
+        print(f"{dataset}:")
+        for stage, r in stages.items():
+            print(
+                f"  {stage:<10} {r['seconds'] * 1000:9.1f} ms "
+                f"{r['rows_per_s'] or 0:>12,} rows/s {r['peak_mb']:8.1f} MB peak"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--synthetic-stop-times", type=int, default=SYNTHETIC_STOP_TIMES
+    )
+    parser.add_argument("--synthetic-shapes", type=int, default=SYNTHETIC_SHAPES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--update-baseline", action="store_true", help=f"rewrite {BASELINE}"
+    )
+    args = parser.parse_args()
+
+    from gen_gtfs import ROUTES, STOPS, TRIPS
+    from synth_feed import synthesize
+
+    results = {}
+    real = dict(trips=TRIPS, stops=STOPS, routes=ROUTES)
+    results["real"] = run({**real, "shapes_dir": f"{script_dir}/shapes"}, args.repeat)
+    with tempfile.TemporaryDirectory() as shapes_dir:
+        routes, trips, stops = synthesize(
+            args.synthetic_stop_times, args.synthetic_shapes, shapes_dir=shapes_dir
+        )
+        synthetic = dict(trips=trips, stops=stops, routes=routes)
+        # Keyed by size so a baseline is only compared at the same scale
+        dataset = f"synthetic_{args.synthetic_stop_times}x{args.synthetic_shapes}"
+        results[dataset] = run({**synthetic, "shapes_dir": shapes_dir}, args.repeat)
+    print_results(results)
+
+    if args.update_baseline:
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        sys.exit(0)
+    if not os.path.exists(BASELINE):
+        sys.exit("No baseline; record one with --update-baseline")
+    with open(BASELINE, encoding="utf-8") as f:
+        found = regressions(results, json.load(f))
+    for message in found:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    sys.exit(1 if found else 0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+blocks.py
+
+Chain trips into vehicle blocks (trips.txt block_id) and work out the
+minimum fleet each service day needs.
+
+Trips are taken in order of departure. Each is given to the vehicle that has
+been waiting longest at its first stop, provided that vehicle arrived at
+least min_layover before, and otherwise to a new vehicle. Afterwards the
+vehicle waits at the trip's last stop. Vehicles waiting at each terminal are
+kept in a heap on arrival time, so a pass is one sort plus a heap push and
+pop per trip, O(n log n). Without deadheading between terminals, this greedy
+pass uses the fewest vehicles possible.
+
+A block has to run on the same days throughout, so block_ids are assigned
+per service_id (DAILY_1, DAILY_2, …). The fleet of a service day pools every
+trip active that day, since a WEEKDAY trip and a DAILY trip can share a
+vehicle; each distinct set of active services is scheduled once.
+
+  usage: blocks.py [--min-layover MINUTES]
+"""
+
+import heapq
+from collections import defaultdict
+from datetime import date, timedelta
+
+from feed_model import active_service_ids
+
+MIN_LAYOVER_S = 10 * 60
+
+
+def chain(trips, min_layover=MIN_LAYOVER_S):
+    """(block number of each trip, number of blocks). Trips without
+    stop_times get None."""
+    runs = sorted(
+        (st[0][0], i, st[0][1], st[-1][0], st[-1][1])
+        for i, trip in enumerate(trips)
+        if (st := trip["stop_times"])
+    )
+    waiting = defaultdict(list)  # stop_id → heap of (arrival, block)
+    blocks = [None] * len(trips)
+    n = 0
+    for start, i, first_stop, end, last_stop in runs:
+        heap = waiting[first_stop]
+        if heap and heap[0][0] <= start - min_layover:
+            block = heapq.heappop(heap)[1]
+        else:
+            block, n = n, n + 1
+        blocks[i] = block
+        heapq.heappush(waiting[last_stop], (end, block))
+    return blocks, n
+
+
+def block_ids(trips, min_layover=MIN_LAYOVER_S):
+    """The block_id of each trip, chained within each service_id (None for
+    trips without stop_times)."""
+    by_service = defaultdict(list)
+    for i, trip in enumerate(trips):
+        by_service[trip["service_id"]].append(i)
+    ids = [None] * len(trips)
+    for service_id, indexes in by_service.items():
+        blocks, _ = chain([trips[i] for i in indexes], min_layover)
+        for i, block in zip(indexes, blocks):
+            if block is not None:
+                ids[i] = f"{service_id}_{block + 1}"
+    return ids
+
+
+def service_days(calendar, calendar_dates):
+    """{frozenset of active service_ids: [dates]} over the calendar's span."""
+    if not calendar:
+        return {}
+    # active_service_ids() scans the exceptions it's given; hand it only the
+    # day's own rows
+    exceptions = defaultdict(list)
+    for cd in calendar_dates:
+        exceptions[int(cd["date"])].append(cd)
+    first = min(int(c["start_date"]) for c in calendar)
+    last = max(int(c["end_date"]) for c in calendar)
+    day = date(first // 10000, first // 100 % 100, first % 100)
+    days = defaultdict(list)
+    while (yyyymmdd := day.year * 10000 + day.month * 100 + day.day) <= last:
+        active = active_service_ids(day, calendar, exceptions.get(yyyymmdd, ()))
+        days[frozenset(active)].append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def fleet_by_service_day(trips, calendar, calendar_dates, min_layover=MIN_LAYOVER_S):
+    """[(active service_ids, dates, minimum fleet)], largest fleet first."""
+    by_service = defaultdict(list)
+    for trip in trips:
+        by_service[trip["service_id"]].append(trip)
+    out = []
+    for services, dates in service_days(calendar, calendar_dates).items():
+        pooled = [trip for sid in sorted(services) for trip in by_service[sid]]
+        out.append((services, dates, chain(pooled, min_layover)[1]))
+    return sorted(out, key=lambda r: (-r[2], r[1][0]))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from gen_gtfs import CALENDAR, CALENDAR_DATES, TRIPS
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--min-layover", type=float, default=MIN_LAYOVER_S / 60, help="minutes"
+    )
+    args = parser.parse_args()
+    min_layover = round(args.min_layover * 60)
+
+    counts = defaultdict(set)
+    for trip, block_id in zip(TRIPS, block_ids(TRIPS, min_layover)):
+        if block_id:
+            counts[trip["service_id"]].add(block_id)
+    print("blocks per service_id:")
+    for service_id, ids in sorted(counts.items()):
+        print(f"  {service_id:<20} {len(ids):>4}")
+    print("minimum fleet per service day:")
+    for services, dates, fleet in fleet_by_service_day(
+        TRIPS, CALENDAR, CALENDAR_DATES, min_layover
+    ):
+        names = ", ".join(sorted(services)) or "(no service)"
+        print(
+            f"  {fleet:>4} vehicles on {len(dates):>4} days "
+            f"(first {dates[0].isoformat()}): {names}"
+        )
@@ -12,8 +12,6 @@ from bs4 import BeautifulSoup
 
 # ── CONFIGURATION ──
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-if not API_KEY:
-    sys.exit("Error: set your GOOGLE_MAPS_API_KEY in the environment")
 
 BROWSER_UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -42,6 +40,8 @@ def extract_iframe_src(html: str) -> str:
 
 
 def geocode_google(address: str) -> tuple[float, float]:
+    if not API_KEY:
+        raise ValueError("set GOOGLE_MAPS_API_KEY to geocode stop addresses")
     resp = requests.get(
         "https://maps.googleapis.com/maps/api/geocode/json",
         params={"address": address, "key": API_KEY},
@@ -98,6 +98,8 @@ def extract_metadata(html: str) -> tuple[str, str]:
 
 # ── MAIN ──
 def main():
+    if not API_KEY:
+        sys.exit("Error: set your GOOGLE_MAPS_API_KEY in the environment")
     stops = fetch_stop_urls(SITEMAP_URL)
     results = []
 
@@ -9,10 +9,12 @@ from the raw HTML, iterating each <div class="schedule"> block and emit a runnab
   - shape_id        = ROUTEID_DIRECTION
   - trip_short_name = last stop name
   - direction_id    = DirectionId.INBOUND.value or DirectionId.OUTBOUND.value
-  - stop_times      = [("HH:MM", stop_id), …]
-"""
+  - stop_times      = [(seconds since service day start, stop_id), …],
+                      emitted as ("HH:MM", stop_id)
 
-from datetime import datetime
+Row titles are resolved to stops through stop_index.StopIndex; titles it
+can't match confidently are dropped from the trips and reported on stderr.
+"""
 
 import requests
 from bs4 import BeautifulSoup
@@ -30,6 +32,8 @@ from gen_gtfs import (
     BikesAllowed,
     DirectionId,
 )
+from gtfs_time import format_time, hhmm, parse_12h, unwrap_midnight
+from stop_index import StopIndex
 
 HEADERS = {
     "User-Agent": (
@@ -56,9 +60,14 @@ def fetch_soup(url):
     return BeautifulSoup(resp.text, "html.parser")
 
 
-def scrape_trips(url, route_id):
-    lookup = {s["stop_name"]: s["stop_id"] for s in STOPS}
-    soup = fetch_soup(url)
+STOP_INDEX = StopIndex(STOPS)
+
+
+def scrape_trips(url, route_id, soup=None, index=STOP_INDEX):
+    """Trips from a route page; soup skips the fetch when it's already parsed.
+    Unresolved row titles are left in index's report()."""
+    if soup is None:
+        soup = fetch_soup(url)
     all_trips = []
 
     # Iterate each schedule block
@@ -78,6 +87,11 @@ def scrape_trips(url, route_id):
         rows = tbl.select("tbody tr")
         if not rows:
             continue
+        # One lookup per row, shared by every trip (column) of the block
+        stop_ids = [
+            index.resolve(row.select_one("td.stop-title").get_text(" ", strip=True))[0]
+            for row in rows
+        ]
 
         # Determine number of columns after the stop-title column
         num_cols = len(rows[0].select("td.cell")) - 1
@@ -96,9 +110,7 @@ def scrape_trips(url, route_id):
                 valid_cols.append((idx, dep12))
 
         for col_idx, dep12 in valid_cols:
-            dep24 = datetime.strptime(dep12, "%I:%M%p").strftime("%H:%M")
-            hhmm = dep24.replace(":", "")
-            trip_id = f"{route_id}_{dir_token}_{hhmm}"
+            trip_id = f"{route_id}_{dir_token}_{hhmm(parse_12h(dep12))}"
             shape_id = f"{route_id}_{dir_token}"
 
             # derive last stop name
@@ -122,16 +134,7 @@ def scrape_trips(url, route_id):
             }
 
             # collect stop_times for this column at each row in order
-            for row in rows:
-                title = row.select_one("td.stop-title").get_text(" ", strip=True)
-                for pfx in ("Leaves ", "Arrives "):
-                    if title.startswith(pfx):
-                        stop_name = title[len(pfx) :]
-                        break
-                else:
-                    stop_name = title
-
-                sid = lookup.get(stop_name)
+            for row, sid in zip(rows, stop_ids):
                 if not sid:
                     continue
 
@@ -139,13 +142,13 @@ def scrape_trips(url, route_id):
                 base = cell.contents[0].strip() if cell.contents else ""
                 ampm = cell.select_one("span.am-pm")
                 if ampm and base and base != "—":
-                    t24 = datetime.strptime(base + ampm.text, "%I:%M%p").strftime(
-                        "%H:%M"
-                    )
-                    trip["stop_times"].append((t24, sid))
+                    trip["stop_times"].append((parse_12h(base + ampm.text), sid))
 
-            # sort stop_times by time
-            trip["stop_times"].sort(key=lambda x: x[0])
+            # Times past midnight continue from 24:00, then sort on the ints
+            times = unwrap_midnight([t for t, _ in trip["stop_times"]])
+            trip["stop_times"] = sorted(
+                zip(times, (sid for _, sid in trip["stop_times"])), key=lambda x: x[0]
+            )
             all_trips.append(trip)
 
     return all_trips
@@ -171,7 +174,7 @@ def emit_python(all_trips):
         print(f"        'bikes_allowed':   BikesAllowed.YES.value,")
         print("        'stop_times':      [")
         for tm, sid in t["stop_times"]:
-            print(f"            ('{tm}', '{sid}'),")
+            print(f"            ('{format_time(tm, seconds=False)}', '{sid}'),")
         print("        ],")
         print("    },")
     print("]")
@@ -182,3 +185,4 @@ if __name__ == "__main__":
     for url, rid in ROUTE_ID_MAP.items():
         all_trips.extend(scrape_trips(url, rid))
     emit_python(all_trips)
+    STOP_INDEX.print_report()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+check_speeds.py
+
+Compare the scheduled gap between consecutive stops of every trip with what
+BRouter routed for the same stretch of its shape (per-vertex "times", or
+"total-time" spread over "track-length" when the times are incomplete).
+
+Each trip's stops are projected onto its shape by PositionEngine, and a
+stop-to-stop leg is flagged when
+
+  - the implied speed is impossible (over MAX_SPEED_KMH, or no time at all)
+  - the schedule is much faster than the routed time (under FAST_FACTOR)
+  - the schedule is much slower than the routed time (over SLOW_FACTOR and
+    at least SLOW_MARGIN_S longer)
+
+Problems use validate_gtfs.py's (severity, file, line, message) format with
+stop_times.txt line numbers.
+
+  usage: check_speeds.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from feed_model import FeedModel
+from gtfs_time import format_time
+from position_engine import PositionEngine
+from validate_gtfs import ERROR, WARNING, print_problems
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+
+MAX_SPEED_KMH = 110
+FAST_FACTOR = 0.75
+SLOW_FACTOR = 2.0
+SLOW_MARGIN_S = 15 * 60
+
+
+def check_speeds(engine: PositionEngine):
+    m = engine.model
+    # Legs between consecutive stop_times of the same trip, both on the shape;
+    # repeated rows for the same stop are a layover, not a leg
+    k = np.flatnonzero(
+        (m.st_trip[1:] == m.st_trip[:-1])
+        & (m.st_stop[1:] != m.st_stop[:-1])
+        & ~np.isnan(engine.st_dist[1:])
+        & ~np.isnan(engine.st_dist[:-1])
+    )
+    dist = engine.st_dist[k + 1] - engine.st_dist[k]
+    routed = engine.st_rtime[k + 1] - engine.st_rtime[k]
+    scheduled = (m.st_arrival[k + 1] - m.st_departure[k]).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kmh = dist / scheduled * 3.6
+        ratio = scheduled / routed
+
+    impossible = (scheduled <= 0) | (kmh > MAX_SPEED_KMH)
+    fast = ~impossible & (ratio < FAST_FACTOR)
+    slow = (ratio > SLOW_FACTOR) & (scheduled - routed > SLOW_MARGIN_S)
+
+    problems = []
+    for flag, severity, what in (
+        (impossible, ERROR, "impossible"),
+        (fast, WARNING, "faster than routed"),
+        (slow, WARNING, "slower than routed"),
+    ):
+        for i in np.flatnonzero(flag):
+            r = int(k[i])
+            problems.append(
+                (
+                    severity,
+                    "stop_times.txt",
+                    r + 3,  # header line plus the leg's second stop_time
+                    f"{m.trip_ids[m.st_trip[r]]} "
+                    f"{m.stop_name[m.st_stop[r]]} {format_time(m.st_departure[r])} → "
+                    f"{m.stop_name[m.st_stop[r + 1]]} "
+                    f"{format_time(m.st_arrival[r + 1])}: {what}, "
+                    f"{dist[i] / 1000:.1f} km in {scheduled[i] / 60:.0f} min "
+                    f"({kmh[i]:.0f} km/h), routed {routed[i] / 60:.0f} min",
+                )
+            )
+    problems.sort(key=lambda p: p[2])
+    return problems
+
+
+if __name__ == "__main__":
+    from gen_gtfs import ROUTES, STOPS, TRIPS
+
+    model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+    model.load_shapes()
+    problems = check_speeds(PositionEngine(model, os.path.join(script_dir, "shapes")))
+    print_problems(problems)
+    sys.exit(1 if any(p[0] == ERROR for p in problems) else 0)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+check_stop_proximity.py
+
+Check that every stop a trip serves lies on the trip's shape, and that the
+stops are met in order along it.
+
+A uniform grid (CELL_DEG cells) is built once over the segments of all
+shapes, keyed by (shape, cell) and stored as a sorted array so a lookup is
+a pair of binary searches. For every (trip, stop) the nearest segment of the
+trip's shape within SEARCH_M is found from the surrounding cells, and
+
+  - stops further than MAX_DISTANCE_M from their shape are flagged
+  - stops whose projections go backwards along the shape are flagged
+
+Each distinct (shape, stop) pair is only measured once. Problems use
+validate_gtfs.py's (severity, file, line, message) format.
+
+  usage: check_stop_proximity.py [--max-distance METRES]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from feed_model import NO_ID, FeedModel
+from position_engine import EARTH_RADIUS_M, cumulative_distance
+from validate_gtfs import WARNING, print_problems
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+
+CELL_DEG = 0.005  # ~550 m of latitude
+SEARCH_M = 2000
+MAX_DISTANCE_M = 150
+M_PER_DEG = np.pi / 180 * EARTH_RADIUS_M
+
+
+class SegmentGrid:
+    def __init__(self, model: FeedModel):
+        self.model = m = model
+        n_shapes = len(m.shape_ids)
+        shape_of_pt = np.repeat(np.arange(n_shapes), np.diff(m.shape_pt))
+        # Segment i runs from point i to point i + 1 within one shape
+        seg = np.flatnonzero(shape_of_pt[:-1] == shape_of_pt[1:])
+        self.seg = seg
+        self.seg_shape = shape_of_pt[seg]
+        self.seg_along = np.zeros(len(m.shape_lat))
+        for s in range(n_shapes):
+            pts = m.shape_slice(s)
+            if pts.stop > pts.start:
+                self.seg_along[pts] = cumulative_distance(
+                    m.shape_lon[pts], m.shape_lat[pts]
+                )
+
+        x0, x1 = m.shape_lon[seg], m.shape_lon[seg + 1]
+        y0, y1 = m.shape_lat[seg], m.shape_lat[seg + 1]
+        self.origin = (
+            (min(x0.min(), x1.min()), min(y0.min(), y1.min())) if len(seg) else (0, 0)
+        )
+        cx0, cy0 = self._cell(np.minimum(x0, x1), np.minimum(y0, y1))
+        cx1, cy1 = self._cell(np.maximum(x0, x1), np.maximum(y0, y1))
+        self.ny = int(cy1.max()) + 2 if len(seg) else 1
+        self.nx = int(cx1.max()) + 2 if len(seg) else 1
+
+        # One entry per (segment, cell its bounding box touches)
+        w, h = cx1 - cx0 + 1, cy1 - cy0 + 1
+        count = w * h
+        entry = np.repeat(np.arange(len(seg)), count)
+        k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        cx = cx0[entry] + k % w[entry]
+        cy = cy0[entry] + k // w[entry]
+        keys = self._key(self.seg_shape[entry], cx, cy)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.entries = entry[order]
+
+    def _cell(self, lon, lat):
+        return (
+            ((lon - self.origin[0]) // CELL_DEG).astype(np.int64),
+            ((lat - self.origin[1]) // CELL_DEG).astype(np.int64),
+        )
+
+    def _key(self, shape, cx, cy):
+        return (shape.astype(np.int64) * self.nx + cx) * self.ny + cy
+
+    def _candidates(self, shape, lon, lat):
+        reach = int(
+            np.ceil(SEARCH_M / (M_PER_DEG * np.cos(np.radians(lat)) * CELL_DEG))
+        )
+        cx, cy = self._cell(np.array([lon]), np.array([lat]))
+        xs = np.arange(cx[0] - reach, cx[0] + reach + 1)
+        xs = xs[(xs >= 0) & (xs < self.nx)]
+        lo_y, hi_y = max(cy[0] - reach, 0), min(cy[0] + reach, self.ny - 1)
+        if not len(xs) or lo_y > hi_y:
+            return np.zeros(0, dtype=np.int64)
+        # Each grid column is one contiguous key range
+        lo = np.searchsorted(self.keys, self._key(np.int64(shape), xs, lo_y), "left")
+        hi = np.searchsorted(self.keys, self._key(np.int64(shape), xs, hi_y), "right")
+        found = [self.entries[a:b] for a, b in zip(lo, hi) if b > a]
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, np.int64)
+
+    def nearest(self, shape, lon, lat):
+        """(metres to the shape, metres along it) of the closest point to lon/lat."""
+        entries = self._candidates(shape, lon, lat)
+        if not len(entries):
+            # Further than SEARCH_M: measure against the whole shape
+            entries = np.flatnonzero(self.seg_shape == shape)
+            if not len(entries):
+                return np.inf, np.nan
+        m, seg = self.model, self.seg[entries]
+        kx = M_PER_DEG * np.cos(np.radians(lat))
+        ax, ay = (m.shape_lon[seg] - lon) * kx, (m.shape_lat[seg] - lat) * M_PER_DEG
+        bx = (m.shape_lon[seg + 1] - lon) * kx
+        by = (m.shape_lat[seg + 1] - lat) * M_PER_DEG
+        dx, dy = bx - ax, by - ay
+        seg_len2 = dx * dx + dy * dy
+        t = np.clip(-(ax * dx + ay * dy) / np.where(seg_len2 > 0, seg_len2, 1), 0, 1)
+        d = np.hypot(ax + t * dx, ay + t * dy)
+        i = int(np.argmin(d))
+        along = self.seg_along[seg[i]] + t[i] * (
+            self.seg_along[seg[i] + 1] - self.seg_along[seg[i]]
+        )
+        return float(d[i]), float(along)
+
+
+def check_stop_proximity(model: FeedModel, max_distance=MAX_DISTANCE_M):
+    grid = SegmentGrid(model)
+    m = model
+    measured = {}  # (shape, stop) -> (distance, along)
+    problems = []
+    for trip in range(m.num_trips):
+        shape = int(m.trip_shape[trip])
+        if shape == NO_ID:
+            continue
+        last_along, last_row = -np.inf, None
+        rows = m.trip_slice(trip)
+        for r in range(rows.start, rows.stop):
+            stop = int(m.st_stop[r])
+            if (shape, stop) not in measured:
+                measured[shape, stop] = grid.nearest(
+                    shape, m.stop_lon[stop], m.stop_lat[stop]
+                )
+            dist, along = measured[shape, stop]
+            where = f"{m.trip_ids[trip]} {m.stop_name[stop]}"
+            shape_id = m.shape_ids[shape]
+            if dist > max_distance:
+                problems.append(
+                    (
+                        WARNING,
+                        "stop_times.txt",
+                        r + 2,
+                        f"{where} is {dist:.0f} m from shape {shape_id}",
+                    )
+                )
+            elif along < last_along - max_distance:
+                problems.append(
+                    (
+                        WARNING,
+                        "stop_times.txt",
+                        r + 2,
+                        f"{where} projects {(last_along - along) / 1000:.1f} km "
+                        f"before {m.stop_name[m.st_stop[last_row]]} along {shape_id}",
+                    )
+                )
+            if dist <= max_distance:
+                last_along, last_row = max(last_along, along), r
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-distance", type=float, default=MAX_DISTANCE_M)
+    args = parser.parse_args()
+
+    from gen_gtfs import ROUTES, STOPS, TRIPS
+
+    model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+    model.load_shapes()
+    problems = check_stop_proximity(model, args.max_distance)
+    print_problems(problems)
+    sys.exit(1 if problems else 0)
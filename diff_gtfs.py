@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+diff_gtfs.py
+
+Show which rows changed between two versions of a GTFS zip, e.g. the
+published concord_coach_gtfs.zip and a fresh build:
+
+  - rows are matched by primary key (trip_id, (trip_id, stop_sequence),
+    stop_id, service_id, (service_id, date), ...)
+  - each table is streamed from both archives and partitioned by key hash
+    into temporary bucket files, so only one bucket is held in memory at a
+    time no matter how large the feeds are
+  - shapes are compared whole: one digest per shape_id over its points
+  - rows after the first with the same key in one feed are reported as
+    duplicates (!) rather than compared
+
+  usage: diff_gtfs.py OLD.zip NEW.zip [--limit N]
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import sys
+import tempfile
+import zlib
+
+from gtfs_reader import GTFSReader
+
+PRIMARY_KEYS = {
+    "agency.txt": ("agency_id",),
+    "stops.txt": ("stop_id",),
+    "routes.txt": ("route_id",),
+    "trips.txt": ("trip_id",),
+    "stop_times.txt": ("trip_id", "stop_sequence"),
+    "calendar.txt": ("service_id",),
+    "calendar_dates.txt": ("service_id", "date"),
+    "frequencies.txt": ("trip_id", "start_time"),
+    "transfers.txt": ("from_stop_id", "to_stop_id", "from_route_id", "to_route_id"),
+    "feed_info.txt": (),
+}
+
+# Bytes of CSV per bucket; sizes the partitioning of large members
+BUCKET_BYTES = 32 << 20
+
+ADDED = "+"
+REMOVED = "-"
+CHANGED = "~"
+DUPLICATE = "!"
+
+
+def _key_columns(header, key_cols):
+    """Index in header of each key column, None for columns it lacks."""
+    return [header.index(c) if c in header else None for c in key_cols]
+
+
+def _key(row, idx):
+    """The key tuple of a CSV row; missing columns and cells key as ""."""
+    return tuple(row[i].strip() if i is not None and i < len(row) else "" for i in idx)
+
+
+def _partition(reader, name, key_cols, buckets, tmpdir, tag):
+    """Split a member into bucket files by key hash; returns the header."""
+    header = reader.header(name) if name in reader else []
+    if not header:
+        return header
+    files = [
+        open(os.path.join(tmpdir, f"{tag}-{i}.csv"), "w", newline="", encoding="utf-8")
+        for i in range(buckets)
+    ]
+    try:
+        writers = [csv.writer(f) for f in files]
+        idx = _key_columns(header, key_cols)
+        with reader.open_text(name) as f:
+            rows = csv.reader(f)
+            next(rows)
+            for row in rows:
+                if not row:
+                    continue
+                key = "\x1f".join(_key(row, idx))
+                writers[zlib.crc32(key.encode()) % buckets].writerow(row)
+    finally:
+        for f in files:
+            f.close()
+    return header
+
+
+def _bucket(tmpdir, tag, i, header, key_cols):
+    """({key: row} for the first row with each key, [(key, row)] for the
+    rows that repeat a key)."""
+    path = os.path.join(tmpdir, f"{tag}-{i}.csv")
+    if not header or not os.path.exists(path):
+        return {}, []
+    idx = _key_columns(header, key_cols)
+    out, duplicates = {}, []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            key = _key(row, idx)
+            r = {h: v.strip() for h, v in zip(header, row)}
+            if key in out:
+                duplicates.append((key, r))
+            else:
+                out[key] = r
+    return out, duplicates
+
+
+def _changed_fields(old, new):
+    return [
+        (c, old.get(c, ""), new.get(c, ""))
+        for c in dict.fromkeys([*old, *new])
+        if old.get(c, "") != new.get(c, "")
+    ]
+
+
+def diff_table(old, new, name, key_cols):
+    """Yield (change, key, detail) for one table present in either feed."""
+    size = max(
+        old._zip.getinfo(name).file_size if name in old else 0,
+        new._zip.getinfo(name).file_size if name in new else 0,
+    )
+    buckets = max(1, size // BUCKET_BYTES + 1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        old_header = _partition(old, name, key_cols, buckets, tmpdir, "old")
+        new_header = _partition(new, name, key_cols, buckets, tmpdir, "new")
+        for i in range(buckets):
+            before, old_duplicates = _bucket(tmpdir, "old", i, old_header, key_cols)
+            after, new_duplicates = _bucket(tmpdir, "new", i, new_header, key_cols)
+            for tag, duplicates in (("old", old_duplicates), ("new", new_duplicates)):
+                for key, row in duplicates:
+                    yield DUPLICATE, key, f"{tag} feed: {','.join(row.values())}"
+            for key in sorted(before.keys() - after.keys()):
+                yield REMOVED, key, before[key]
+            for key in sorted(after.keys() - before.keys()):
+                yield ADDED, key, after[key]
+            for key in sorted(before.keys() & after.keys()):
+                fields = _changed_fields(before[key], after[key])
+                if fields:
+                    yield CHANGED, key, fields
+
+
+def _shape_digests(reader):
+    """shape_id -> (digest, point count), streamed from shapes.txt."""
+    digests = {}
+    columns = ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence")
+    for c in reader.chunks("shapes.txt", columns):
+        for row in zip(*(c[k] for k in columns)):
+            h, n = digests.get(row[0]) or (hashlib.blake2b(digest_size=16), 0)
+            h.update(",".join(v.strip() for v in row[1:]).encode() + b"\n")
+            digests[row[0]] = (h, n + 1)
+    return {k: (h.digest(), n) for k, (h, n) in digests.items()}
+
+
+def diff_shapes(old, new):
+    before, after = _shape_digests(old), _shape_digests(new)
+    for key in sorted(before.keys() - after.keys()):
+        yield REMOVED, (key,), f"{before[key][1]} points"
+    for key in sorted(after.keys() - before.keys()):
+        yield ADDED, (key,), f"{after[key][1]} points"
+    for key in sorted(before.keys() & after.keys()):
+        if before[key][0] != after[key][0]:
+            yield CHANGED, (key,), f"{before[key][1]} → {after[key][1]} points"
+
+
+def diff_feeds(old_path, new_path):
+    """Yield (table, change, key, detail) for every difference."""
+    with GTFSReader(old_path) as old, GTFSReader(new_path) as new:
+        names = sorted(set(old.members) | set(new.members))
+        for name in names:
+            if name == "shapes.txt":
+                for change, key, detail in diff_shapes(old, new):
+                    yield name, change, key, detail
+                continue
+            key_cols = PRIMARY_KEYS.get(name)
+            if key_cols is None:
+                # Unknown table: key on every column of whichever header we have
+                key_cols = tuple(old.header(name) if name in old else new.header(name))
+            for change, key, detail in diff_table(old, new, name, key_cols):
+                yield name, change, key, detail
+
+
+def _format(change, key, detail):
+    label = "/".join(key) or "(row)"
+    if change == CHANGED and isinstance(detail, list):
+        detail = ", ".join(f"{c}: {a!r} → {b!r}" for c, a, b in detail)
+    elif isinstance(detail, dict):
+        detail = ",".join(detail.values())
+    return f"  {change} {label}: {detail}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--limit", type=int, default=20, help="rows to print per table (-1: all)"
+    )
+    args = parser.parse_args()
+
+    counts = {}
+    for table, change, key, detail in diff_feeds(args.old, args.new):
+        table_counts = counts.setdefault(
+            table, {ADDED: 0, REMOVED: 0, CHANGED: 0, DUPLICATE: 0}
+        )
+        if args.limit < 0 or sum(table_counts.values()) < args.limit:
+            if not any(table_counts.values()):
+                print(table)
+            print(_format(change, key, detail))
+        table_counts[change] += 1
+
+    for table, c in counts.items():
+        line = f"{table}: {c[ADDED]} added, {c[REMOVED]} removed, {c[CHANGED]} changed"
+        if c[DUPLICATE]:
+            line += f", {c[DUPLICATE]} duplicate keys"
+        print(line, file=sys.stderr)
+    sys.exit(1 if counts else 0)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+export_arrow.py
+
+Write the feed tables as typed columnar files next to the GTFS zip, so
+analytics can load them without re-parsing CSV:
+
+  - Parquet (zstd-compressed) in concord_coach_gtfs_parquet/, or
+  - Arrow IPC (uncompressed, memory-mappable) in concord_coach_gtfs_arrow/
+
+Times (arrival_time, departure_time, start_time, end_time) are int32 seconds
+since the start of the service day, dates are date32, coordinates float64,
+and every *_id column is dictionary-encoded.
+
+  usage: export_arrow.py [parquet|arrow]   (default: parquet)
+"""
+
+import os
+import shutil
+import sys
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from gtfs_time import parse_time
+from records import DATE_COLUMNS, FLOAT_COLUMNS, TIME_COLUMNS
+
+
+def _date(v):
+    v = int(v)
+    return date(v // 10000, v // 100 % 100, v % 100)
+
+
+def _column(name, values):
+    if name in TIME_COLUMNS:
+        return pa.array(
+            [None if v in ("", None) else parse_time(v) for v in values], pa.int32()
+        )
+    if name in DATE_COLUMNS:
+        return pa.array([_date(v) if v != "" else None for v in values], pa.date32())
+    if name in FLOAT_COLUMNS:
+        return pa.array([float(v) if v != "" else None for v in values], pa.float64())
+    if name.endswith("_id") and name not in ("direction_id",):
+        return pa.array([str(v) for v in values], pa.string()).dictionary_encode()
+    if all(isinstance(v, int) for v in values):
+        return pa.array(values, pa.int32())
+    return pa.array([str(v) for v in values], pa.string())
+
+
+def to_arrow(rows) -> pa.Table:
+    """A typed Arrow table from a list of row dicts (the build_tables() rows)."""
+    # One pass per column; ChunkedRows (shapes.txt) would re-read each time
+    rows = list(rows)
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    return pa.table({c: _column(c, [row.get(c, "") for row in rows]) for c in columns})
+
+
+def _fresh_dir(out_dir):
+    """Empty out_dir, so tables from an earlier export (e.g. a
+    frequencies.txt of a --frequencies build) don't linger next to these."""
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+
+def write_parquet(tables, out_dir):
+    _fresh_dir(out_dir)
+    for filename, rows in tables.items():
+        path = os.path.join(out_dir, filename.replace(".txt", ".parquet"))
+        pq.write_table(to_arrow(rows), path, compression="zstd")
+
+
+def write_arrow(tables, out_dir):
+    _fresh_dir(out_dir)
+    for filename, rows in tables.items():
+        table = to_arrow(rows)
+        path = os.path.join(out_dir, filename.replace(".txt", ".arrow"))
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def read_table(path) -> pa.Table:
+    """Memory-map one exported table (.parquet or .arrow)."""
+    if path.endswith(".arrow"):
+        return pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return pq.read_table(path, memory_map=True)
+
+
+if __name__ == "__main__":
+    from gen_gtfs import build_tables, feed_path
+
+    fmt = sys.argv[1] if len(sys.argv) > 1 else "parquet"
+    out_dir = f"{feed_path}_{fmt}"
+    {"parquet": write_parquet, "arrow": write_arrow}[fmt](build_tables(), out_dir)
+    for name in sorted(os.listdir(out_dir)):
+        path = os.path.join(out_dir, name)
+        print(
+            f"{name}: {read_table(path).num_rows} rows, {os.path.getsize(path)} bytes"
+        )
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+export_sqlite.py
+
+Write the feed into an SQLite database for ad-hoc schedule queries:
+
+  - one table per GTFS file, times as INTEGER seconds since the start of the
+    service day, dates as ISO "YYYY-MM-DD" text
+  - indexes on stop_times(stop_id, departure_time), trips(route_id,
+    service_id), calendar_dates(date) and each table's primary key
+  - service_dates(service_id, date): calendar.txt expanded day by day, with
+    calendar_dates.txt exceptions applied
+  - departures: every scheduled departure by date and stop, e.g.
+
+      SELECT * FROM departures
+      WHERE date = '2026-11-25' AND stop_name = 'Concord, NH';
+
+Rows are bulk-inserted in one transaction into a temporary file that
+replaces the database once it's complete.
+
+  usage: export_sqlite.py [DB]   (default: concord_coach_gtfs.sqlite)
+"""
+
+import os
+import sqlite3
+import sys
+
+from diff_gtfs import PRIMARY_KEYS
+from feed_model import WEEKDAYS
+from gtfs_time import parse_time
+from records import DATE_COLUMNS, FLOAT_COLUMNS, TIME_COLUMNS
+
+INDEXES = {
+    "stop_times": ("stop_id", "departure_time"),
+    "trips": ("route_id", "service_id"),
+    "calendar_dates": ("date",),
+}
+
+_WEEKDAY_CASE = " ".join(
+    f"WHEN '{(i + 1) % 7}' THEN c.{day}" for i, day in enumerate(WEEKDAYS)
+)
+
+VIEWS = f"""
+CREATE VIEW service_dates AS
+WITH RECURSIVE span(service_id, date, end_date) AS (
+    SELECT service_id, start_date, end_date FROM calendar
+    UNION ALL
+    SELECT service_id, date(date, '+1 day'), end_date FROM span
+    WHERE date < end_date
+)
+SELECT s.service_id, s.date FROM span s JOIN calendar c USING (service_id)
+WHERE CASE strftime('%w', s.date) {_WEEKDAY_CASE} END = 1
+  AND NOT EXISTS (
+    SELECT 1 FROM calendar_dates d
+    WHERE d.service_id = s.service_id AND d.date = s.date
+      AND d.exception_type = 2)
+UNION
+SELECT service_id, date FROM calendar_dates WHERE exception_type = 1;
+
+CREATE VIEW departures AS
+SELECT sd.date, st.stop_id, s.stop_name,
+       printf('%02d:%02d:%02d', st.departure_time / 3600,
+              st.departure_time / 60 % 60, st.departure_time % 60)
+           AS departure_time,
+       t.route_id, r.route_long_name, t.trip_id, t.direction_id
+FROM service_dates sd
+JOIN trips t ON t.service_id = sd.service_id
+JOIN stop_times st ON st.trip_id = t.trip_id
+JOIN stops s ON s.stop_id = st.stop_id
+JOIN routes r ON r.route_id = t.route_id
+ORDER BY sd.date, st.departure_time;
+"""
+
+
+def _sql_type(name, values):
+    if name in DATE_COLUMNS:  # stored as ISO text by _converter
+        return "TEXT"
+    if name in TIME_COLUMNS or all(isinstance(v, int) for v in values):
+        return "INTEGER"
+    if name in FLOAT_COLUMNS:
+        return "REAL"
+    return "TEXT"
+
+
+def _converter(name):
+    if name in TIME_COLUMNS:
+        return lambda v: None if v in ("", None) else parse_time(v)
+    if name in DATE_COLUMNS:
+        return lambda v: f"{str(v)[:4]}-{str(v)[4:6]}-{str(v)[6:8]}" if v else None
+    return lambda v: None if v == "" else v
+
+
+def write_sqlite(tables, path):
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    con = sqlite3.connect(tmp, isolation_level=None)
+    # Nothing to recover if the build dies halfway: the .tmp is thrown away
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute("BEGIN")
+    for filename, rows in tables.items():
+        name = filename.removesuffix(".txt")
+        # Several passes follow; ChunkedRows (shapes.txt) would re-read each time
+        rows = list(rows)
+        columns = list(dict.fromkeys(k for row in rows for k in row))
+        types = [_sql_type(c, [row.get(c, "") for row in rows]) for c in columns]
+        con.execute(
+            f"CREATE TABLE {name} ("
+            + ", ".join(f"{c} {t}" for c, t in zip(columns, types))
+            + ")"
+        )
+        convert = [_converter(c) for c in columns]
+        con.executemany(
+            f"INSERT INTO {name} VALUES ({', '.join('?' * len(columns))})",
+            ([f(row.get(c, "")) for f, c in zip(convert, columns)] for row in rows),
+        )
+        # Indexes are built once after the bulk insert rather than per row
+        if PRIMARY_KEYS.get(filename):
+            key = ", ".join(PRIMARY_KEYS[filename])
+            con.execute(f"CREATE UNIQUE INDEX {name}_pkey ON {name} ({key})")
+        if name in INDEXES:
+            cols = INDEXES[name]
+            con.execute(
+                f"CREATE INDEX {name}_{'_'.join(cols)} ON {name} ({', '.join(cols)})"
+            )
+    for view in VIEWS.split(";\n\n"):
+        con.execute(view)
+    con.execute("COMMIT")
+    con.execute("ANALYZE")
+    con.close()
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    from gen_gtfs import build_tables, feed_path
+
+    path = sys.argv[1] if len(sys.argv) > 1 else f"{feed_path}.sqlite"
+    write_sqlite(build_tables(), path)
+    con = sqlite3.connect(path)
+    for (name,) in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+    ):
+        if not name.startswith("sqlite_"):
+            count = con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+            print(f"{name}: {count} rows")
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+feed_archive.py
+
+Write the GTFS zip with every member deflated concurrently, at a compression
+level chosen per member.
+
+Each member is serialised to CSV (straight from its Records, see
+records.py) and compressed with zlib (which releases the GIL) in a thread
+pool; the deflated streams are then laid out as a standard zip with one
+local header per member and a central directory. A member given as
+ChunkedRows (shapes.txt) is never held whole: it is encoded a chunk at a
+time and deflated and written as it goes, with its local header filled in
+afterwards, so memory stays flat however large it is.
+Levels come from a profile in PROFILES, optionally overridden per member:
+
+  - store:   no compression, for quick local inspection
+  - fast:    level 1, for dev builds
+  - default: level 6, what shutil.make_archive produced
+  - max:     level 9, for the published feed
+
+Run directly to compare the size/time trade-off of every profile on the
+current feed.
+
+  usage: feed_archive.py
+"""
+
+import csv
+import io
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from records import TIME_COLUMNS, Record, csv_time
+
+PROFILES = {
+    "store": {"*": 0},
+    "fast": {"*": 1},
+    "default": {"*": 6},
+    "max": {"*": 9},
+}
+DEFAULT_PROFILE = "default"
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_VERSION = 20  # 2.0: deflate
+_LOCAL = struct.Struct("<4s5H3L2H")
+_CENTRAL = struct.Struct("<4s6H3L5H2L")
+_END = struct.Struct("<4s4H2LH")
+
+# Members are deflated in CHUNK_BYTES pieces so one large member (shapes.txt)
+# still spreads across threads; each piece ends on a sync flush, so the pieces
+# concatenate into a single valid stream, pigz-style.
+CHUNK_BYTES = 1 << 20
+WINDOW_BYTES = 32 << 10
+
+
+def member_levels(names, profile=DEFAULT_PROFILE, overrides=None):
+    """{member: level} from a profile name, with per-member overrides."""
+    levels = {**PROFILES[profile], **(overrides or {})}
+    return {name: levels.get(name, levels["*"]) for name in names}
+
+
+class ChunkedRows:
+    """Rows of a table too large to hold at once. chunks() returns a fresh
+    iterable of row lists each time it's called; iterating the ChunkedRows
+    yields every row of every chunk, so it reads like a list of rows to code
+    that only iterates."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+
+def _deflate(piece, zdict, level: int, last: bool):
+    """Deflate piece as one part of a raw deflate stream."""
+    t0 = time.perf_counter()
+    # Priming with the preceding window keeps the ratio close to one stream
+    if zdict:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    packed = c.compress(piece) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return packed, time.perf_counter() - t0
+
+
+def to_csv(rows, header=True) -> bytes:
+    """CSV for an iterable of rows: Records of one type, or dicts whose
+    columns are the union of their keys in order of first appearance. Int
+    times are written as HH:MM:SS. Without header, only the data lines are
+    written, for pieces of a table encoded separately."""
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return b""
+    if isinstance(first, Record):
+        csv_row = type(first).csv_row()
+        if header:
+            writer.writerow(type(first).__slots__)
+        writer.writerow(csv_row(first))
+        writer.writerows(map(csv_row, rows))
+    else:
+        rows = [first, *rows]
+        columns = list(dict.fromkeys(k for row in rows for k in row))
+        if header:
+            writer.writerow(columns)
+        writer.writerows(
+            [csv_time(row.get(k)) if k in TIME_COLUMNS else row.get(k) for k in columns]
+            for row in rows
+        )
+    return out.getvalue().encode("utf-8")
+
+
+def _dos_time(when):
+    t = time.localtime(when)
+    return (
+        t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+        (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday,
+    )
+
+
+def _csv_pieces(rows: ChunkedRows):
+    """CSV of ChunkedRows, one piece per chunk, header on the first."""
+    header = True
+    for chunk in rows.chunks():
+        piece = to_csv(chunk, header)
+        if piece:
+            header = False
+            yield piece
+
+
+def _encode(rows):
+    return _csv_pieces(rows) if isinstance(rows, ChunkedRows) else to_csv(rows)
+
+
+def encode_tables(tables, jobs=None):
+    """{filename: rows} → {filename: CSV bytes}, or for ChunkedRows a
+    one-shot iterator of CSV pieces (encoded as write_members consumes it)."""
+    with ThreadPoolExecutor(jobs or os.cpu_count() or 1) as pool:
+        return dict(zip(tables, pool.map(_encode, tables.values())))
+
+
+def write_archive(tables, path, levels, jobs=None):
+    """Write {filename: rows} to the zip at path; returns one report row per
+    member: (name, level, size, compressed size, compress CPU seconds)."""
+    return write_members(encode_tables(tables, jobs), path, levels, jobs)
+
+
+def _write_streamed(f, pool, pieces, level, depth):
+    """Write a member given as an iterable of byte pieces to f, deflating
+    CHUNK_BYTES blocks in pool with at most depth in flight. Returns (size,
+    crc, compressed size, compress CPU seconds)."""
+    size = crc = written = 0
+    seconds = 0.0
+    inflight = deque()
+    window = b""
+
+    def drain(keep):
+        nonlocal written, seconds
+        while len(inflight) > keep:
+            packed, s = inflight.popleft().result()
+            f.write(packed)
+            written += len(packed)
+            seconds += s
+
+    def put(block, last):
+        nonlocal size, crc, window, written
+        size += len(block)
+        crc = zlib.crc32(block, crc)
+        if not level:
+            f.write(block)
+            written += len(block)
+            return
+        inflight.append(pool.submit(_deflate, block, window, level, last))
+        window = block[-WINDOW_BYTES:]
+        drain(depth)
+
+    buffered, n = [], 0
+    for piece in pieces:
+        buffered.append(piece)
+        n += len(piece)
+        if n >= CHUNK_BYTES:
+            put(b"".join(buffered), False)
+            buffered, n = [], 0
+    put(b"".join(buffered), True)
+    drain(0)
+    return size, crc, written, seconds
+
+
+def write_members(datas, path, levels, jobs=None, cache=None):
+    """write_archive() for members already encoded as {filename: bytes}, or
+    as an iterable of byte pieces for a member streamed to the zip as it is
+    encoded (see ChunkedRows).
+
+    cache, a dict kept by the caller between writes, holds each member's
+    deflated stream; bytes members whose bytes and level are unchanged since
+    the last write reuse it instead of being compressed again (and report
+    0 s)."""
+    names, datas = list(datas), list(datas.values())
+    cache = {} if cache is None else cache
+    jobs = jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(jobs) as pool:
+        pending = {}
+        for name, data in zip(names, datas):
+            level = levels[name]
+            if not isinstance(data, bytes) or cache.get(name, ())[:2] == (level, data):
+                continue
+            view = memoryview(data)
+            pending[name] = (
+                pool.submit(zlib.crc32, data),
+                (
+                    [
+                        pool.submit(
+                            _deflate,
+                            view[i : i + CHUNK_BYTES],
+                            view[max(i - WINDOW_BYTES, 0) : i],
+                            level,
+                            i + CHUNK_BYTES >= len(data),
+                        )
+                        for i in range(0, max(len(data), 1), CHUNK_BYTES)
+                    ]
+                    if level
+                    else []
+                ),
+            )
+
+        dos_time, dos_date = _dos_time(time.time())
+        tmp = f"{path}.tmp"
+        central, report = [], []
+        with open(tmp, "wb") as f:
+            for name, data in zip(names, datas):
+                encoded = name.encode("utf-8")
+                level = levels[name]
+                offset = f.tell()
+                # The local header goes in front of the data; a streamed
+                # member's is only known once it's written, so it's patched in
+                f.write(b"\0" * (_LOCAL.size + len(encoded)))
+                if isinstance(data, bytes):
+                    seconds = 0.0
+                    if name in pending:
+                        crc, futures = pending[name]
+                        results = [future.result() for future in futures]
+                        packed = b"".join(r[0] for r in results) if futures else data
+                        seconds = sum(r[1] for r in results)
+                        cache[name] = (level, data, crc.result(), packed)
+                    crc, packed = cache[name][2:]
+                    f.write(packed)
+                    size, packed_size = len(data), len(packed)
+                else:
+                    size, crc, packed_size, seconds = _write_streamed(
+                        f, pool, data, level, 2 * jobs
+                    )
+                fields = (
+                    ZIP_VERSION,
+                    0,
+                    ZIP_DEFLATED if level else ZIP_STORED,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    packed_size,
+                    size,
+                )
+                end = f.tell()
+                f.seek(offset)
+                f.write(_LOCAL.pack(b"PK\x03\x04", *fields, len(encoded), 0))
+                f.write(encoded)
+                f.seek(end)
+                central.append(
+                    _CENTRAL.pack(
+                        b"PK\x01\x02",
+                        3 << 8 | ZIP_VERSION,  # made by: Unix
+                        *fields,
+                        len(encoded),
+                        0,
+                        0,
+                        0,
+                        0,
+                        0o644 << 16,
+                        offset,
+                    )
+                    + encoded
+                )
+                report.append((name, level, size, packed_size, seconds))
+            start = f.tell()
+            f.write(b"".join(central))
+            f.write(
+                _END.pack(
+                    b"PK\x05\x06",
+                    0,
+                    0,
+                    len(names),
+                    len(names),
+                    f.tell() - start,
+                    start,
+                    0,
+                )
+            )
+    os.replace(tmp, path)
+    return report
+
+
+def print_report(report, elapsed=None):
+    for name, level, size, packed, seconds in report:
+        print(
+            f"  {name:<20} level {level}  {size:>10,} → {packed:>10,} bytes"
+            f"  {seconds * 1000:7.1f} ms"
+        )
+    size = sum(r[2] for r in report)
+    packed = sum(r[3] for r in report)
+    total = f"  {'total':<20}          {size:>10,} → {packed:>10,} bytes"
+    if elapsed is not None:
+        total += f"  {elapsed * 1000:7.1f} ms wall"
+    print(total)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from gen_gtfs import build_tables
+
+    tables = build_tables()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for profile in PROFILES:
+            start = time.perf_counter()
+            report = write_archive(
+                tables,
+                os.path.join(tmpdir, f"{profile}.zip"),
+                member_levels(tables, profile),
+            )
+            print(f"{profile}:")
+            print_report(report, time.perf_counter() - start)
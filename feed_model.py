@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+feed_model.py
+
+Columnar representation of the feed. Stops, trips, stop_times and shape points
+are held as NumPy arrays, string IDs are interned to dense integers and times
+are integer seconds since the start of the service day:
+
+  - stops       = stop_lat / stop_lon, indexed by interned stop_id
+  - trips       = trip_route / trip_service / trip_shape / ..., indexed by trip_id
+  - stop_times  = st_trip / st_stop / st_arrival / st_departure / st_sequence,
+                  grouped by trip; trip i owns rows trip_st[i]:trip_st[i + 1]
+  - shapes      = shape_lat / shape_lon, shape s owns points
+                  shape_pt[s]:shape_pt[s + 1]
+
+FeedModel.from_trips() / to_trips() / to_stops() convert to and from the
+TRIPS / STOPS structures in gen_gtfs.py.
+"""
+
+import os
+
+import numpy as np
+
+from gtfs_time import parse_time
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+
+NO_ID = -1  # Missing optional reference (e.g. a trip without a shape_id)
+NO_TIME = -1  # Blank arrival/departure (non-timepoint stop_time)
+
+
+WEEKDAYS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+
+
+def active_service_ids(day, calendar, calendar_dates) -> set[str]:
+    """service_ids running on a datetime.date per calendar / calendar_dates rows."""
+    yyyymmdd = int(day.strftime("%Y%m%d"))
+    weekday = WEEKDAYS[day.weekday()]
+    active = {
+        c["service_id"]
+        for c in calendar
+        if int(c["start_date"]) <= yyyymmdd <= int(c["end_date"]) and int(c[weekday])
+    }
+    for cd in calendar_dates:
+        if int(cd["date"]) == yyyymmdd:
+            if int(cd["exception_type"]) == 1:
+                active.add(cd["service_id"])
+            else:
+                active.discard(cd["service_id"])
+    return active
+
+
+def _float(value) -> float:
+    return np.nan if value is None or value == "" else float(value)
+
+
+class Interner:
+    """Bidirectional map between string IDs and dense integers 0..n-1."""
+
+    def __init__(self, values=()):
+        self.index = {}
+        self.values = []
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value: str) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def get(self, value: str, default: int = NO_ID) -> int:
+        return self.index.get(value, default)
+
+    def __getitem__(self, i: int) -> str:
+        return self.values[i]
+
+    def __contains__(self, value) -> bool:
+        return value in self.index
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+class FeedModel:
+    def __init__(self):
+        self.stop_ids = Interner()
+        self.route_ids = Interner()
+        self.service_ids = Interner()
+        self.shape_ids = Interner()
+        self.trip_ids = Interner()
+
+        # stops
+        self.stop_lat = np.zeros(0, dtype=np.float64)
+        self.stop_lon = np.zeros(0, dtype=np.float64)
+        self.stop_name = []
+        self.stop_desc = []
+
+        # trips
+        self.trip_route = np.zeros(0, dtype=np.int32)
+        self.trip_service = np.zeros(0, dtype=np.int32)
+        self.trip_shape = np.zeros(0, dtype=np.int32)
+        self.trip_direction = np.zeros(0, dtype=np.int8)
+        self.trip_bikes = np.zeros(0, dtype=np.int8)
+        self.trip_short_name = []
+        self.trip_st = np.zeros(1, dtype=np.int64)
+
+        # stop_times
+        self.st_trip = np.zeros(0, dtype=np.int32)
+        self.st_stop = np.zeros(0, dtype=np.int32)
+        self.st_arrival = np.zeros(0, dtype=np.int32)
+        self.st_departure = np.zeros(0, dtype=np.int32)
+        self.st_sequence = np.zeros(0, dtype=np.int32)
+
+        # shapes
+        self.shape_lat = np.zeros(0, dtype=np.float64)
+        self.shape_lon = np.zeros(0, dtype=np.float64)
+        self.shape_pt = np.zeros(1, dtype=np.int64)
+
+    # ── CONSTRUCTION ──
+
+    def set_stops(self, stops):
+        """Load a STOPS-style list of dicts; stop_ids seen in trips are kept."""
+        for s in stops:
+            self.stop_ids.intern(s["stop_id"])
+        n = len(self.stop_ids)
+        self.stop_lat = np.full(n, np.nan, dtype=np.float64)
+        self.stop_lon = np.full(n, np.nan, dtype=np.float64)
+        self.stop_name = [""] * n
+        self.stop_desc = [""] * n
+        for s in stops:
+            i = self.stop_ids.index[s["stop_id"]]
+            self.stop_lat[i] = _float(s.get("stop_lat"))
+            self.stop_lon[i] = _float(s.get("stop_lon"))
+            self.stop_name[i] = s.get("stop_name", "")
+            self.stop_desc[i] = s.get("stop_desc", "")
+
+    def set_trips(self, trips):
+        """Load a TRIPS-style list of dicts.
+
+        Trips carrying a "stop_times" list also fill the stop_times columns;
+        rows read from trips.txt have none and are followed by set_stop_times().
+        """
+        n = len(trips)
+        route = np.empty(n, dtype=np.int32)
+        service = np.empty(n, dtype=np.int32)
+        shape = np.empty(n, dtype=np.int32)
+        direction = np.empty(n, dtype=np.int8)
+        bikes = np.empty(n, dtype=np.int8)
+        short_name = []
+        counts = np.empty(n, dtype=np.int64)
+        st_stop, st_time = [], []
+
+        for i, trip in enumerate(trips):
+            if self.trip_ids.intern(trip["trip_id"]) != i:
+                raise ValueError(f"Duplicate trip_id {trip['trip_id']}")
+            route[i] = self.route_ids.intern(trip["route_id"])
+            service[i] = self.service_ids.intern(trip["service_id"])
+            shape_id = trip.get("shape_id")
+            shape[i] = self.shape_ids.intern(shape_id) if shape_id else NO_ID
+            direction[i] = int(trip.get("direction_id") or 0)
+            bikes[i] = int(trip.get("bikes_allowed") or 0)
+            short_name.append(trip.get("trip_short_name", ""))
+            stop_times = trip.get("stop_times", ())
+            counts[i] = len(stop_times)
+            for time, stop_id in stop_times:
+                st_time.append(parse_time(time))
+                st_stop.append(self.stop_ids.intern(stop_id))
+
+        self.trip_route = route
+        self.trip_service = service
+        self.trip_shape = shape
+        self.trip_direction = direction
+        self.trip_bikes = bikes
+        self.trip_short_name = short_name
+        self.trip_st = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.trip_st[1:])
+
+        self.st_trip = np.repeat(np.arange(n, dtype=np.int32), counts)
+        self.st_stop = np.array(st_stop, dtype=np.int32)
+        self.st_arrival = np.array(st_time, dtype=np.int32)
+        self.st_departure = self.st_arrival.copy()
+        self.st_sequence = (
+            np.arange(len(self.st_trip), dtype=np.int64)
+            - np.repeat(self.trip_st[:-1], counts)
+        ).astype(np.int32)
+
+    def set_stop_times(self, trip, stop, arrival, departure, sequence):
+        """Load stop_times from parallel arrays of interned trip/stop indices.
+
+        Rows may arrive in any order; they are grouped by trip and ordered by
+        stop_sequence. Trips unknown to trips.txt get NO_ID references.
+        """
+        trip = np.asarray(trip, dtype=np.int32)
+        sequence = np.asarray(sequence, dtype=np.int32)
+        order = np.lexsort((sequence, trip))
+        self.st_trip = trip[order]
+        self.st_stop = np.asarray(stop, dtype=np.int32)[order]
+        self.st_arrival = np.asarray(arrival, dtype=np.int32)[order]
+        self.st_departure = np.asarray(departure, dtype=np.int32)[order]
+        self.st_sequence = sequence[order]
+
+        n = len(self.trip_ids)
+        pad = n - len(self.trip_route)
+        if pad > 0:
+            missing = np.full(pad, NO_ID, dtype=np.int32)
+            self.trip_route = np.concatenate([self.trip_route, missing])
+            self.trip_service = np.concatenate([self.trip_service, missing])
+            self.trip_shape = np.concatenate([self.trip_shape, missing])
+            zeros = np.zeros(pad, dtype=np.int8)
+            self.trip_direction = np.concatenate([self.trip_direction, zeros])
+            self.trip_bikes = np.concatenate([self.trip_bikes, zeros])
+            self.trip_short_name += [""] * pad
+        self.trip_st = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.st_trip, minlength=n), out=self.trip_st[1:])
+
+    def set_shape_points(self, shape, lat, lon, sequence):
+        """Load shape points from parallel arrays of interned shape indices."""
+        shape = np.asarray(shape, dtype=np.int32)
+        order = np.lexsort((np.asarray(sequence), shape))
+        self.shape_lat = np.asarray(lat, dtype=np.float64)[order]
+        self.shape_lon = np.asarray(lon, dtype=np.float64)[order]
+        n = len(self.shape_ids)
+        self.shape_pt = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(shape, minlength=n), out=self.shape_pt[1:])
+
+    def set_shapes(self, shapes):
+        """Load shape geometry from an iterable of (shape_id, [(lon, lat, ...), …])."""
+        points = {}
+        for shape_id, coords in shapes:
+            # GeoJSON positions may or may not carry an elevation
+            arr = np.array([c[:2] for c in coords], dtype=np.float64).reshape(-1, 2)
+            points[self.shape_ids.intern(shape_id)] = arr
+        # Lay points out in interned order; shapes without geometry get none
+        empty = np.zeros((0, 2))
+        arrs = [points.get(i, empty) for i in range(len(self.shape_ids))]
+        counts = [len(a) for a in arrs]
+        self.shape_lon = np.concatenate([a[:, 0] for a in arrs] + [empty[:, 0]])
+        self.shape_lat = np.concatenate([a[:, 1] for a in arrs] + [empty[:, 1]])
+        self.shape_pt = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.shape_pt[1:])
+
+    def load_shapes(self, shapes_dir=None):
+        """Read shapes/<shape_id>.geojson for every shape_id referenced by a trip."""
+        from gen_gtfs import _coords
+
+        shapes_dir = shapes_dir or os.path.join(script_dir, "shapes")
+        self.set_shapes(
+            (shape_id, _coords(os.path.join(shapes_dir, f"{shape_id}.geojson")))
+            for shape_id in list(self.shape_ids)
+        )
+
+    @classmethod
+    def from_trips(cls, trips, stops, routes=()):
+        model = cls()
+        for r in routes:
+            model.route_ids.intern(r["route_id"])
+        for s in stops:
+            model.stop_ids.intern(s["stop_id"])
+        model.set_trips(trips)
+        model.set_stops(stops)
+        return model
+
+    # ── ACCESS ──
+
+    @property
+    def num_trips(self) -> int:
+        return len(self.trip_ids)
+
+    @property
+    def num_stop_times(self) -> int:
+        return len(self.st_trip)
+
+    def trip_slice(self, trip: int) -> slice:
+        return slice(int(self.trip_st[trip]), int(self.trip_st[trip + 1]))
+
+    def shape_slice(self, shape: int) -> slice:
+        return slice(int(self.shape_pt[shape]), int(self.shape_pt[shape + 1]))
+
+    # ── CONVERSION BACK ──
+
+    def to_stops(self):
+        return [
+            {
+                "stop_id": stop_id,
+                "stop_name": self.stop_name[i],
+                "stop_desc": self.stop_desc[i],
+                "stop_lat": float(self.stop_lat[i]),
+                "stop_lon": float(self.stop_lon[i]),
+            }
+            for i, stop_id in enumerate(self.stop_ids)
+        ]
+
+    def to_trips(self):
+        trips = []
+        for i, trip_id in enumerate(self.trip_ids):
+            rows = self.trip_slice(i)
+            trip = {
+                "route_id": self.route_ids[self.trip_route[i]],
+                "service_id": self.service_ids[self.trip_service[i]],
+                "trip_id": trip_id,
+                "trip_short_name": self.trip_short_name[i],
+                "direction_id": int(self.trip_direction[i]),
+            }
+            if self.trip_shape[i] != NO_ID:
+                trip["shape_id"] = self.shape_ids[self.trip_shape[i]]
+            trip["bikes_allowed"] = int(self.trip_bikes[i])
+            trip["stop_times"] = [
+                (int(t), self.stop_ids[s])
+                for t, s in zip(
+                    self.st_departure[rows].tolist(), self.st_stop[rows].tolist()
+                )
+            ]
+            trips.append(trip)
+        return trips
+
+
+if __name__ == "__main__":
+    from gen_gtfs import ROUTES, STOPS, TRIPS
+
+    model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+    model.load_shapes()
+    assert model.to_trips() == TRIPS
+    print(
+        f"{len(model.stop_ids)} stops, {len(model.route_ids)} routes, "
+        f"{model.num_trips} trips, {model.num_stop_times} stop_times, "
+        f"{len(model.shape_ids)} shapes / {len(model.shape_lat)} points"
+    )
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+frequencies.py
+
+Collapse headway-based service into frequencies.txt and expand it back.
+
+Trips are grouped by everything but their trip_id and times: route, service,
+shape, direction, headsign, bikes, stop pattern and the offsets of each stop
+from the first departure. Within a group, runs of at least MIN_RUN trips
+departing at a constant headway become one template trip (the first of the
+run) plus a frequencies.txt row with exact_times=1. Its end_time is one
+second after the last departure: with exact_times=1 the spec wants it past
+the last start but short of last start + headway_secs, which would imply one
+more trip.
+
+Expanded trips are named by replacing the template's HHMM in its trip_id
+with their own departure (PORTLAND_BOS_SOUTHBOUND_0315 → ..._0415). A run is
+only collapsed when that naming reproduces the original trip_ids, so
+expand_frequencies(*collapse_frequencies(TRIPS)) gives back TRIPS exactly
+(in departure order within each run).
+
+  usage: frequencies.py
+"""
+
+from gtfs_time import format_time, hhmm, parse_time
+
+MIN_RUN = 3
+
+
+def expanded_trip_id(template_id, template_start, start):
+    old, new = hhmm(template_start), hhmm(start)
+    if old in template_id:
+        return template_id.replace(old, new, 1)
+    return f"{template_id}_{new}"
+
+
+def _signature(trip, times):
+    first = times[0]
+    return (
+        tuple((k, v) for k, v in trip.items() if k not in ("trip_id", "stop_times")),
+        tuple(sid for _, sid in trip["stop_times"]),
+        tuple(t - first for t in times),
+    )
+
+
+def collapse_frequencies(trips, min_run=MIN_RUN):
+    """Return (trips with runs replaced by templates, frequencies.txt rows)."""
+    groups = {}
+    for i, trip in enumerate(trips):
+        times = [t for t, _ in trip["stop_times"]]
+        if times:
+            groups.setdefault(_signature(trip, times), []).append((times[0], i))
+
+    template_of = {}  # index of a collapsed trip -> None, template -> row
+    for members in groups.values():
+        members.sort()
+        start = 0
+        while start < len(members):
+            end = start + 1
+            if end < len(members):
+                headway = members[end][0] - members[start][0]
+                while (
+                    end < len(members)
+                    and members[end][0] - members[end - 1][0] == headway
+                    and headway > 0
+                ):
+                    end += 1
+            run = members[start:end]
+            first_t, first_i = run[0]
+            template_id = trips[first_i]["trip_id"]
+            if len(run) >= min_run and all(
+                trips[i]["trip_id"] == expanded_trip_id(template_id, first_t, t)
+                for t, i in run
+            ):
+                template_of[first_i] = {
+                    "trip_id": template_id,
+                    "start_time": first_t,
+                    "end_time": run[-1][0] + 1,
+                    "headway_secs": headway,
+                    "exact_times": 1,
+                }
+                for _, i in run[1:]:
+                    template_of[i] = None
+                start = end
+            else:
+                start += 1
+
+    collapsed, frequencies = [], []
+    for i, trip in enumerate(trips):
+        if i not in template_of:
+            collapsed.append(trip)
+        elif template_of[i] is not None:
+            collapsed.append(trip)
+            frequencies.append(template_of[i])
+    return collapsed, frequencies
+
+
+def expand_frequencies(trips, frequencies):
+    """Turn template trips back into one trip per exact_times departure."""
+    by_trip = {}
+    for row in frequencies:
+        by_trip.setdefault(row["trip_id"], []).append(row)
+    expanded = []
+    for trip in trips:
+        rows = by_trip.get(trip["trip_id"])
+        if not rows:
+            expanded.append(trip)
+            continue
+        times = [t for t, _ in trip["stop_times"]]
+        for row in rows:
+            start, end = parse_time(row["start_time"]), parse_time(row["end_time"])
+            for dep in range(start, end, int(row["headway_secs"])):
+                shift = dep - times[0]
+                expanded.append(
+                    {
+                        **trip,
+                        "trip_id": expanded_trip_id(trip["trip_id"], times[0], dep),
+                        "stop_times": [
+                            (t + shift, sid)
+                            for t, (_, sid) in zip(times, trip["stop_times"])
+                        ],
+                    }
+                )
+    return expanded
+
+
+if __name__ == "__main__":
+    from gen_gtfs import TRIPS
+
+    collapsed, frequencies = collapse_frequencies(TRIPS)
+    expanded = expand_frequencies(collapsed, frequencies)
+    assert sorted(expanded, key=lambda t: t["trip_id"]) == sorted(
+        TRIPS, key=lambda t: t["trip_id"]
+    )
+    for row in frequencies:
+        print(
+            f"{row['trip_id']}: every {row['headway_secs'] // 60} min "
+            f"{format_time(row['start_time'])}–{format_time(row['end_time'])}"
+        )
+    before = sum(len(t["stop_times"]) for t in TRIPS)
+    after = sum(len(t["stop_times"]) for t in collapsed)
+    print(f"{len(TRIPS)} → {len(collapsed)} trips, {before} → {after} stop_times")
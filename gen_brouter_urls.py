@@ -6,10 +6,34 @@ For each trip in your GTFS TRIPS, generate a BRouter-Web URL
 (with car-fast profile) including a default map view centered
 at zoom 8 / 43.269,-70.464, applying South Station and Logan Airport
 overrides. Print only unique combinations of shape_id and URL.
+
+With --fetch, route every shape_id's stop sequence on a locally running
+BRouter server instead (same overrides, car-fast profile) and write the
+result to shapes/<shape_id>.geojson. Requests run concurrently with bounded
+parallelism, and responses are cached in .brouter_cache/ by a hash of the
+waypoint list, so rerunning only routes sequences that changed.
+
+  usage: gen_brouter_urls.py [--fetch [--server URL] [--jobs N] [--force]]
 """
 
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
 from gen_gtfs import STOPS, TRIPS
 
+script_dir = os.path.dirname(os.path.realpath(__file__))
+shapes_dir = os.path.join(script_dir, "shapes")
+CACHE_DIR = os.path.join(script_dir, ".brouter_cache")
+
+BROUTER_SERVER = os.getenv("BROUTER_SERVER", "http://localhost:17777")
+PROFILE = "car-fast"
+
 # STOP IDs for overrides
 SOUTH_STATION_ID = "STOP-0a858b61-d2dc-44f8-a6fd-9a528df6a3a8"
 LOGAN_AIRPORT_ID = "STOP-9a1d503f-4812-4ec4-af0d-6275316cc2c4"
@@ -26,31 +50,126 @@ LOGAN_OVERRIDE_POINT = (-71.018114, 42.365582)
 # build stop_id → (lon, lat) lookup
 stop_lookup = {s["stop_id"]: (s["stop_lon"], s["stop_lat"]) for s in STOPS}
 
+BASE_URL = "https://brouter.de/brouter-web/#map=8/43.269/-70.464/standard&lonlats="
+PROFILE_SUFFIX = f"&profile={PROFILE}"
+
+
+def brouter_waypoints(stop_ids):
+    """Waypoints (lon, lat) for a stop sequence, and the South Station index."""
+    coords = []
+    south_index = None
+
+    # apply overrides and build coords list
+    for sid in stop_ids:
+        if sid == SOUTH_STATION_ID:
+            south_index = len(coords)
+            coords.extend(SOUTH_STRAIGHT_POINTS)
+        elif sid == LOGAN_AIRPORT_ID:
+            coords.append(LOGAN_OVERRIDE_POINT)
+        else:
+            coords.append(stop_lookup[sid])
+    return coords, south_index
+
+
+def brouter_url(stop_ids):
+    coords, south_index = brouter_waypoints(stop_ids)
+    lonlats = ";".join(f"{lon},{lat}" for lon, lat in coords)
+    straight_param = f"&straight={south_index}" if south_index is not None else ""
+    return f"{BASE_URL}{lonlats}{PROFILE_SUFFIX}{straight_param}"
+
+
+def waypoint_hash(coords, south_index):
+    key = json.dumps([PROFILE, coords, south_index]).encode()
+    return hashlib.sha256(key).hexdigest()[:32]
+
+
+def fetch_route(server, coords, south_index):
+    """Route waypoints on a BRouter server; returns the GeoJSON dict."""
+    params = {
+        "lonlats": "|".join(f"{lon},{lat}" for lon, lat in coords),
+        "profile": PROFILE,
+        "alternativeidx": 0,
+        "format": "geojson",
+    }
+    if south_index is not None:
+        params["straight"] = south_index
+    resp = requests.get(f"{server}/brouter", params=params, timeout=300)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def fetch_shapes(server=BROUTER_SERVER, jobs=4, force=False):
+    """Route each shape_id's stop sequence, reusing cached routes."""
+    sequences = {}
+    for trip in TRIPS:
+        sorted_st = sorted(trip["stop_times"], key=lambda x: x[0])
+        seq = [sid for time, sid in sorted_st]
+        if sequences.setdefault(trip["shape_id"], seq) != seq:
+            print(
+                f"{trip['shape_id']}: {trip['trip_id']} has a different stop "
+                "sequence; using the first",
+                file=sys.stderr,
+            )
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    manifest_path = os.path.join(CACHE_DIR, "manifest.json")
+    manifest = {}  # shape_id -> waypoint hash of the file currently in shapes/
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    def route(item):
+        shape_id, seq = item
+        coords, south_index = brouter_waypoints(seq)
+        digest = waypoint_hash(coords, south_index)
+        cached = os.path.join(CACHE_DIR, f"{digest}.json")
+        out = os.path.join(shapes_dir, f"{shape_id}.geojson")
+        if os.path.exists(cached) and not force:
+            if manifest.get(shape_id) == digest and os.path.exists(out):
+                return shape_id, digest, "unchanged"
+            with open(cached, "r", encoding="utf-8") as f:
+                fc = json.load(f)
+            status = "from cache"
+        else:
+            fc = fetch_route(server, coords, south_index)
+            with open(cached, "w", encoding="utf-8") as f:
+                json.dump(fc, f)
+            status = "routed"
+        fc["features"][0]["properties"]["name"] = shape_id
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(fc, f, indent=2)
+        return shape_id, digest, status
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for shape_id, digest, status in pool.map(route, sorted(sequences.items())):
+                manifest[shape_id] = digest
+                yield shape_id, status
+    finally:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+
 if __name__ == "__main__":
-    base = "https://brouter.de/brouter-web/#map=8/43.269/-70.464/standard&lonlats="
-    suffix = "&profile=car-fast"
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--fetch", action="store_true", help="route on a local BRouter server"
+    )
+    parser.add_argument("--server", default=BROUTER_SERVER)
+    parser.add_argument("--jobs", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--force", action="store_true", help="re-route even if cached")
+    args = parser.parse_args()
+
+    if args.fetch:
+        for shape_id, status in fetch_shapes(args.server, args.jobs, args.force):
+            print(f"{shape_id}: {status}")
+        sys.exit()
 
     seen = set()
     for trip in TRIPS:
-        # sort stop_times by the HH:MM string
+        # sort stop_times by time (int seconds, so trips past midnight sort right)
         sorted_st = sorted(trip["stop_times"], key=lambda x: x[0])
-
-        coords = []
-        south_index = None
-
-        # apply overrides and build coords list
-        for time, sid in sorted_st:
-            if sid == SOUTH_STATION_ID:
-                south_index = len(coords)
-                coords.extend(SOUTH_STRAIGHT_POINTS)
-            elif sid == LOGAN_AIRPORT_ID:
-                coords.append(LOGAN_OVERRIDE_POINT)
-            else:
-                coords.append(stop_lookup[sid])
-
-        lonlats = ";".join(f"{lon},{lat}" for lon, lat in coords)
-        straight_param = f"&straight={south_index}" if south_index is not None else ""
-        url = f"{base}{lonlats}{suffix}{straight_param}"
+        url = brouter_url([sid for time, sid in sorted_st])
 
         key = (trip["shape_id"], url)
         if key in seen:
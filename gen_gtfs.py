@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 
+import json
 import os
-import shutil
-import tempfile
+import sys
 from datetime import date, datetime, timedelta
 from enum import Enum
+from functools import partial
 from pathlib import Path
 
-import geojson
 import holidays
-import pandas as pd
+
+from blocks import MIN_LAYOVER_S, block_ids
+from feed_archive import (
+    DEFAULT_PROFILE,
+    PROFILES,
+    ChunkedRows,
+    member_levels,
+    write_archive,
+)
+from gtfs_time import parse_time
+from records import Route, ShapePoint, Stop, StopTime, Trip
+from transfers import build_transfers
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
 feed_path = Path(script_dir) / "concord_coach_gtfs"
@@ -55,9 +66,10 @@ class ServiceException(Enum):
 
 def _coords(fp):
     """Helper to open fp and return its first feature’s LineString coords."""
+    # Plain json: geojson.load builds an object per position and is ~20x slower
     with open(fp, "r", encoding="utf-8") as f:
-        fc = geojson.load(f)
-    return fc.features[0].geometry.coordinates
+        fc = json.load(f)
+    return fc["features"][0]["geometry"]["coordinates"]
 
 
 # Agency Info
@@ -2019,6 +2031,11 @@ TRIPS = [
     },
 ]
 
+# stop_times are written as "HH:MM" above for readability and held as int
+# seconds since the start of the service day (24:00 and later past midnight)
+for _trip in TRIPS:
+    _trip["stop_times"] = [(parse_time(t), sid) for t, sid in _trip["stop_times"]]
+
 STOPS = [
     {
         "stop_id": "STOP-aad6393e-f519-4661-9d97-138a5c77f389",
@@ -2369,67 +2386,256 @@ def is_in_semester(d):
     )
 
 
-CALENDAR_DATES = [
-    {
-        "service_id": WEEKDAY_SERVICE_ID,
-        "date": int(d.strftime("%Y%m%d")),  # e.g. 20250704
-        "exception_type": ServiceException.REMOVED.value,
-    }
-    for d in sorted(holidays.US(years=range(2025, 2030)).keys())
-] + [
-    {
-        "service_id": sid,
-        "date": int(d.strftime("%Y%m%d")),
-        "exception_type": ServiceException.REMOVED.value,
-    }
-    for sid in [EXT_WEEKEND_SERVICE_ID, FRI_SUN_UMAINE_SERVICE_ID]
-    for i in range((date(2029, 5, 28) - date(2025, 5, 28)).days + 1)
-    if not is_in_semester(d := date(2025, 5, 28) + timedelta(days=i))
-]
+def build_calendar_dates():
+    """Holiday and out-of-semester removals for the services in CALENDAR."""
+    return [
+        {
+            "service_id": WEEKDAY_SERVICE_ID,
+            "date": int(d.strftime("%Y%m%d")),  # e.g. 20250704
+            "exception_type": ServiceException.REMOVED.value,
+        }
+        for d in sorted(holidays.US(years=range(2025, 2030)).keys())
+    ] + [
+        {
+            "service_id": sid,
+            "date": int(d.strftime("%Y%m%d")),
+            "exception_type": ServiceException.REMOVED.value,
+        }
+        for sid in [EXT_WEEKEND_SERVICE_ID, FRI_SUN_UMAINE_SERVICE_ID]
+        for i in range((date(2029, 5, 28) - date(2025, 5, 28)).days + 1)
+        if not is_in_semester(d := date(2025, 5, 28) + timedelta(days=i))
+    ]
 
-if __name__ == "__main__":
-    FILES = {
+
+CALENDAR_DATES = build_calendar_dates()
+
+
+def build_tables(
+    shapes=True,
+    frequencies=False,
+    trips=TRIPS,
+    stops=STOPS,
+    routes=ROUTES,
+    calendar=CALENDAR,
+    calendar_dates=CALENDAR_DATES,
+    shapes_dir=f"{script_dir}/shapes",
+    min_layover=MIN_LAYOVER_S,
+):
+    """Flatten the feed definitions above into {filename: rows}.
+
+    Trips that don't set their own block_id are chained into vehicle blocks
+    (see blocks.py) with at least min_layover seconds at each turnaround.
+    With frequencies, constant-headway runs of trips are collapsed into
+    template trips plus frequencies.txt (see frequencies.py); a template
+    stands for the runs of several vehicles, so only the trips left as they
+    are get chained and the templates get no block_id.
+    transfers.txt lists the connections between routes the timetable offers
+    (see transfers.py). shapes.txt is ChunkedRows read shape by shape, so
+    writing it never holds every point at once.
+    The data arguments let other feeds (e.g. synth_feed.py's) go through the
+    same path.
+    """
+    all_trips, frequency_rows = trips, None
+    if frequencies:
+        from frequencies import collapse_frequencies
+
+        trips, frequency_rows = collapse_frequencies(trips)
+
+    trip_rows = list(map(Trip.from_mapping, trips))
+    templates = {f["trip_id"] for f in frequency_rows or ()}
+    scheduled = [i for i, t in enumerate(trips) if t["trip_id"] not in templates]
+    chained = block_ids([trips[i] for i in scheduled], min_layover)
+    for i, block_id in zip(scheduled, chained):
+        if trip_rows[i].block_id is None:
+            trip_rows[i].block_id = block_id
+
+    tables = {
         "agency.txt": [AGENCY],
-        "stops.txt": STOPS,
-        "routes.txt": ROUTES,
-        "trips.txt": [
-            {k: v for k, v in trip.items() if k != "stop_times"} for trip in TRIPS
-        ],
-        "stop_times.txt": [
-            item
-            for sublist in [
-                [
-                    {
-                        "trip_id": trip["trip_id"],
-                        "arrival_time": f"{time}:00",
-                        "departure_time": f"{time}:00",
-                        "stop_id": stop_id,
-                        "stop_sequence": i,
-                    }
-                    for i, (time, stop_id) in enumerate(trip["stop_times"])
-                ]
-                for trip in TRIPS
-            ]
-            for item in sublist
-        ],
-        "calendar.txt": CALENDAR,
-        "calendar_dates.txt": CALENDAR_DATES,
+        "stops.txt": list(map(Stop.from_mapping, stops)),
+        "routes.txt": list(map(Route.from_mapping, routes)),
+        "trips.txt": trip_rows,
+        "stop_times.txt": list(iter_stop_times(trips)),
+        "calendar.txt": calendar,
+        "calendar_dates.txt": calendar_dates,
         "feed_info.txt": [FEED_INFO],
-        "shapes.txt": [
-            {
-                "shape_id": shape_id,
-                "shape_pt_lat": lat,
-                "shape_pt_lon": lon,
-                "shape_pt_sequence": seq,
-            }
-            for shape_id in sorted({t["shape_id"] for t in TRIPS if "shape_id" in t})
-            for seq, (lon, lat, *_) in enumerate(
-                _coords(f"{script_dir}/shapes/{shape_id}.geojson"), start=1
-            )
-        ],
     }
+    if frequency_rows:
+        tables["frequencies.txt"] = frequency_rows
+    transfer_rows, _ = build_transfers(all_trips, stops, calendar, calendar_dates)
+    if transfer_rows:
+        tables["transfers.txt"] = transfer_rows
+    if shapes:
+        shape_ids = sorted({t["shape_id"] for t in all_trips if "shape_id" in t})
+        tables["shapes.txt"] = ChunkedRows(
+            partial(iter_shape_chunks, shape_ids, shapes_dir)
+        )
+    return tables
+
+
+def iter_stop_times(trips):
+    """StopTime records for every trip's stop_times, in trip order."""
+    for trip in trips:
+        trip_id = trip["trip_id"]
+        for i, (time, stop_id) in enumerate(trip["stop_times"]):
+            yield StopTime(trip_id, time, time, stop_id, i)
+
+
+def iter_shape_points(shape_ids, shapes_dir=f"{script_dir}/shapes"):
+    """ShapePoint records for shape_ids, read from <shapes_dir>/<shape_id>.geojson."""
+    for shape_id in shape_ids:
+        coords = _coords(f"{shapes_dir}/{shape_id}.geojson")
+        for seq, (lon, lat, *_) in enumerate(coords, start=1):
+            yield ShapePoint(shape_id, lat, lon, seq)
+
+
+def iter_shape_chunks(shape_ids, shapes_dir=f"{script_dir}/shapes"):
+    """The ShapePoint records of each shape in turn, one list per shape."""
+    for shape_id in shape_ids:
+        yield list(iter_shape_points([shape_id], shapes_dir))
+
+
+def write_feed(tables, path=feed_path, profile=DEFAULT_PROFILE, levels=None):
+    """Write {filename: rows} to <path>.zip; levels override the profile's
+    compression level per member. Returns feed_archive.write_archive's report."""
+    return write_archive(tables, f"{path}.zip", member_levels(tables, profile, levels))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--frequencies",
+        action="store_true",
+        help="collapse constant-headway trips into frequencies.txt",
+    )
+    parser.add_argument(
+        "--min-layover",
+        type=float,
+        default=MIN_LAYOVER_S / 60,
+        metavar="MINUTES",
+        help="shortest turnaround when chaining trips into blocks "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--export",
+        choices=["parquet", "arrow", "sqlite"],
+        action="append",
+        default=[],
+        help="also write typed tables to concord_coach_gtfs_<format>/ "
+        "(or concord_coach_gtfs.sqlite)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=PROFILES,
+        default=DEFAULT_PROFILE,
+        help="archive compression profile (see feed_archive.py)",
+    )
+    parser.add_argument(
+        "--level",
+        action="append",
+        default=[],
+        metavar="MEMBER=N",
+        help="compression level for one member, e.g. shapes.txt=9",
+    )
+    parser.add_argument(
+        "--archive-report",
+        action="store_true",
+        help="print each member's size and compression time",
+    )
+    parser.add_argument(
+        "--tiles",
+        action="store_true",
+        help="also cut shapes and stops into vector tiles in "
+        "concord_coach_gtfs_tiles/ (see vector_tiles.py)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="rebuild the zip whenever gen_gtfs.py or shapes/ changes "
+        "(see watch_feed.py)",
+    )
+    args = parser.parse_args()
+    levels = {}
+    for item in args.level:
+        member, _, level = item.partition("=")
+        levels[member] = int(level)
+
+    if args.watch:
+        from watch_feed import watch
+
+        unsupported = [
+            flag
+            for flag, given in (
+                ("--export", args.export),
+                ("--tiles", args.tiles),
+                ("--archive-report", args.archive_report),
+            )
+            if given
+        ]
+        if unsupported:
+            parser.error(f"--watch doesn't support {', '.join(unsupported)}")
+        try:
+            watch(
+                args.compression,
+                levels,
+                args.frequencies,
+                round(args.min_layover * 60),
+            )
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    from shape_stitcher import print_unresolved, stitch_missing_shapes
+    from validate_gtfs import ERROR, print_problems, source_shape_ids, validate
+
+    # New stop sequences get shapes stitched from existing segments; any that
+    # can't be are left for brouter-web and fail validation below
+    stitched, unresolved = stitch_missing_shapes(TRIPS, STOPS, ROUTES)
+    for shape_id in stitched:
+        print(f"{shape_id}: stitched from existing segments", file=sys.stderr)
+    print_unresolved(unresolved, STOPS)
+
+    # Gate the build on the feed definitions being structurally sound
+    problems = validate(
+        build_tables(shapes=False, frequencies=args.frequencies), source_shape_ids()
+    )
+    print_problems(problems)
+    if any(severity == ERROR for severity, *_ in problems):
+        sys.exit("Feed validation failed")
+
+    # Schedule vs. routed speed and stop-to-shape problems are reported but
+    # don't block the build
+    from check_speeds import check_speeds
+    from check_stop_proximity import check_stop_proximity
+    from feed_model import FeedModel
+    from position_engine import PositionEngine
+
+    model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+    model.load_shapes()
+    print_problems(check_speeds(PositionEngine(model, Path(script_dir) / "shapes")))
+    print_problems(check_stop_proximity(model))
+
+    tables = build_tables(
+        frequencies=args.frequencies, min_layover=round(args.min_layover * 60)
+    )
+    report = write_feed(tables, profile=args.compression, levels=levels)
+    if args.archive_report:
+        from feed_archive import print_report
+
+        print_report(report)
+
+    for fmt in args.export:
+        if fmt == "sqlite":
+            from export_sqlite import write_sqlite
+
+            write_sqlite(tables, f"{feed_path}.sqlite")
+        else:
+            import export_arrow
+
+            getattr(export_arrow, f"write_{fmt}")(tables, f"{feed_path}_{fmt}")
+
+    if args.tiles:
+        from vector_tiles import load_lines, load_stops, write_tiles
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        for filename, data in FILES.items():
-            pd.DataFrame(data).to_csv(Path(tmpdirname) / filename, index=False)
-        shutil.make_archive(str(feed_path), "zip", tmpdirname)
+        write_tiles(f"{feed_path}_tiles", load_lines(), load_stops())
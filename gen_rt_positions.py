@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+gen_rt_positions.py
+
+Simulated GTFS-Realtime VehiclePositions feed for the scheduled service, for
+load-testing realtime ingestion.
+
+At each tick the trips running at the simulated time are found from TRIPS and
+the calendar, and every bus is placed along its shape by PositionEngine, which
+interpolates between scheduled stop times following BRouter's per-vertex
+"times". Positions for all active trips are computed in one NumPy batch per
+tick.
+
+With --feed, the times are read from <shapes dir>/<shape_id>.geojson
+(shapes/ by default, which covers the feeds gen_gtfs.py builds); shapes with
+no such file move at position_engine.DEFAULT_SPEED_MPS along shapes.txt.
+
+  usage: gen_rt_positions.py [--start ISO8601] [--rate HZ] [--duration SECONDS]
+                             [--out FILE] [--feed GTFS.zip] [--shapes-dir DIR]
+                             [--no-sleep]
+
+--out may contain "{timestamp}" to keep every snapshot instead of
+overwriting one file.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+
+from feed_model import NO_ID, FeedModel, active_service_ids
+from position_engine import PositionEngine
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+class Simulator:
+    def __init__(self, model: FeedModel, calendar, calendar_dates, shapes_dir=None):
+        self.model = model
+        self.engine = PositionEngine(model, shapes_dir)
+        self.calendar = calendar
+        self.calendar_dates = calendar_dates
+        self._services = {}
+
+    def services_on(self, day):
+        if day not in self._services:
+            active = active_service_ids(day, self.calendar, self.calendar_dates)
+            self._services[day] = np.isin(
+                self.model.trip_service,
+                [self.model.service_ids.get(s) for s in active],
+            )
+        return self._services[day]
+
+    def active_trips(self, when: datetime):
+        """(trip indices, seconds into their service day) for trips running at when."""
+        trips, secs = [], []
+        for back in (0, 1):  # trips after midnight belong to yesterday's service day
+            day = when.date() - timedelta(days=back)
+            noon = datetime(day.year, day.month, day.day, 12, tzinfo=when.tzinfo)
+            t = int((when - (noon - timedelta(hours=12))).total_seconds())
+            idx = self.engine.active(t, self.services_on(day))
+            trips.append(idx)
+            secs.append(np.full(len(idx), t, dtype=np.int64))
+        return np.concatenate(trips), np.concatenate(secs)
+
+    def snapshot(self, when: datetime) -> bytes:
+        trips, t = self.active_trips(when)
+        lon, lat, bearing, _ = self.engine.positions(trips, t)
+        ts = int(when.timestamp())
+
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.header.gtfs_realtime_version = "2.0"
+        feed.header.incrementality = gtfs_realtime_pb2.FeedHeader.FULL_DATASET
+        feed.header.timestamp = ts
+        m = self.model
+        for i, trip in enumerate(trips.tolist()):
+            trip_id = m.trip_ids[trip]
+            start = when - timedelta(seconds=int(t[i]) - 12 * 3600)
+            entity = feed.entity.add()
+            entity.id = trip_id
+            vehicle = entity.vehicle
+            vehicle.trip.trip_id = trip_id
+            if m.trip_route[trip] != NO_ID:
+                vehicle.trip.route_id = m.route_ids[m.trip_route[trip]]
+            vehicle.trip.start_date = start.strftime("%Y%m%d")
+            vehicle.vehicle.id = trip_id
+            vehicle.position.longitude = lon[i]
+            vehicle.position.latitude = lat[i]
+            vehicle.position.bearing = bearing[i]
+            vehicle.timestamp = ts
+        return feed.SerializeToString()
+
+
+def _write(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--start", help="simulated start time (default: now)")
+    parser.add_argument("--rate", type=float, default=1.0, help="snapshots per second")
+    parser.add_argument("--duration", type=float, help="simulated seconds to run")
+    parser.add_argument("--out", default="vehicle_positions.pb")
+    parser.add_argument("--feed", help="simulate a GTFS zip instead of gen_gtfs.py")
+    parser.add_argument(
+        "--shapes-dir",
+        default=os.path.join(script_dir, "shapes"),
+        help="BRouter GeoJSON per shape_id (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-sleep", action="store_true", help="generate as fast as possible"
+    )
+    args = parser.parse_args()
+
+    from gen_gtfs import AGENCY
+
+    tz = ZoneInfo(AGENCY["agency_timezone"])
+    if args.feed:
+        from gtfs_reader import GTFSReader
+
+        with GTFSReader(args.feed) as reader:
+            sim = Simulator(
+                reader.model, reader.calendar, reader.calendar_dates, args.shapes_dir
+            )
+            tz = ZoneInfo(reader.agency[0]["agency_timezone"])
+    else:
+        from gen_gtfs import CALENDAR, CALENDAR_DATES, ROUTES, STOPS, TRIPS
+
+        model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+        model.load_shapes()
+        sim = Simulator(model, CALENDAR, CALENDAR_DATES, args.shapes_dir)
+
+    clock = datetime.fromisoformat(args.start) if args.start else datetime.now(tz)
+    if clock.tzinfo is None:
+        clock = clock.replace(tzinfo=tz)
+    step = timedelta(seconds=1 / args.rate)
+    end = clock + timedelta(seconds=args.duration) if args.duration else None
+    next_tick = time.monotonic()
+    while end is None or clock < end:
+        data = sim.snapshot(clock)
+        out = args.out.format(timestamp=int(clock.timestamp()))
+        _write(out, data)
+        clock += step
+        if not args.no_sleep:
+            next_tick += step.total_seconds()
+            time.sleep(max(0.0, next_tick - time.monotonic()))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+gtfs_reader.py
+
+Read a GTFS zip (by default the published concord_coach_gtfs.zip) back into
+the FeedModel from feed_model.py.
+
+The archive is opened once, memory-mapped where the platform allows, and each
+member is only decoded on first access. stop_times.txt and shapes.txt are
+streamed in fixed-size chunks straight into typed arrays, so feeds far larger
+than ours load without building per-row dicts or pandas frames.
+
+  usage: gtfs_reader.py [feed.zip]
+"""
+
+import csv
+import io
+import mmap
+import os
+import sys
+import zipfile
+from itertools import islice
+
+import numpy as np
+
+from feed_model import NO_TIME, FeedModel
+from gtfs_time import parse_time
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_FEED = os.path.join(script_dir, "concord_coach_gtfs.zip")
+
+CHUNK_ROWS = 1 << 16
+
+
+class _MappedFile(mmap.mmap):
+    # zipfile wants a seekable file object; mmap only gained seekable() in 3.13
+    def seekable(self):
+        return True
+
+
+def _time(value: str) -> int:
+    return parse_time(value) if value else NO_TIME
+
+
+class GTFSReader:
+    def __init__(self, path=DEFAULT_FEED):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = _MappedFile(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and some filesystems can't be mapped
+            self._map = None
+        self._zip = zipfile.ZipFile(self._map or self._file)
+        self._tables = {}
+        self._model = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    # ── RAW MEMBER ACCESS ──
+
+    @property
+    def members(self) -> list[str]:
+        return self._zip.namelist()
+
+    def __contains__(self, name) -> bool:
+        return name in self._zip.NameToInfo
+
+    def open_text(self, name):
+        # utf-8-sig drops the BOM some producers write
+        return io.TextIOWrapper(self._zip.open(name), encoding="utf-8-sig", newline="")
+
+    def header(self, name) -> list[str]:
+        with self.open_text(name) as f:
+            return [h.strip() for h in next(csv.reader(f), [])]
+
+    def rows(self, name):
+        """Yield each row of a member as a dict, streaming from the archive."""
+        if name not in self:
+            return
+        with self.open_text(name) as f:
+            reader = csv.reader(f)
+            header = [h.strip() for h in next(reader, [])]
+            for row in reader:
+                if row:
+                    yield dict(zip(header, row))
+
+    def chunks(self, name, columns, chunk_rows=CHUNK_ROWS):
+        """Yield {column: [values…]} for consecutive chunks of a member.
+
+        Columns missing from the member come back as lists of "".
+        """
+        if name not in self:
+            return
+        with self.open_text(name) as f:
+            reader = csv.reader(f)
+            header = [h.strip() for h in next(reader, [])]
+            idx = [header.index(c) if c in header else None for c in columns]
+            while True:
+                block = [r for r in islice(reader, chunk_rows) if r]
+                if not block:
+                    break
+                yield {
+                    c: [r[i] for r in block] if i is not None else [""] * len(block)
+                    for c, i in zip(columns, idx)
+                }
+
+    def table(self, name) -> list[dict]:
+        """Decode a (small) member into a list of dicts, once."""
+        if name not in self._tables:
+            self._tables[name] = list(self.rows(name))
+        return self._tables[name]
+
+    # ── SMALL TABLES ──
+
+    @property
+    def agency(self):
+        return self.table("agency.txt")
+
+    @property
+    def stops(self):
+        return self.table("stops.txt")
+
+    @property
+    def routes(self):
+        return self.table("routes.txt")
+
+    @property
+    def trips(self):
+        return self.table("trips.txt")
+
+    @property
+    def calendar(self):
+        return self.table("calendar.txt")
+
+    @property
+    def calendar_dates(self):
+        return self.table("calendar_dates.txt")
+
+    @property
+    def feed_info(self):
+        return self.table("feed_info.txt")
+
+    # ── COLUMNAR MODEL ──
+
+    @property
+    def model(self) -> FeedModel:
+        if self._model is None:
+            self._model = self.load_model()
+        return self._model
+
+    def load_model(self, shapes=True) -> FeedModel:
+        model = FeedModel()
+        for r in self.rows("routes.txt"):
+            model.route_ids.intern(r["route_id"])
+        stops = list(self.rows("stops.txt"))
+        for s in stops:
+            model.stop_ids.intern(s["stop_id"])
+        model.set_trips(list(self.rows("trips.txt")))
+        self._load_stop_times(model)
+        model.set_stops(stops)
+        if shapes:
+            self._load_shapes(model)
+        return model
+
+    def _load_stop_times(self, model):
+        trip_ids, stop_ids = model.trip_ids, model.stop_ids
+        trip, stop, arr, dep, seq = [], [], [], [], []
+        columns = (
+            "trip_id",
+            "stop_id",
+            "arrival_time",
+            "departure_time",
+            "stop_sequence",
+        )
+        for c in self.chunks("stop_times.txt", columns):
+            trip.append(np.fromiter(map(trip_ids.intern, c["trip_id"]), np.int32))
+            stop.append(np.fromiter(map(stop_ids.intern, c["stop_id"]), np.int32))
+            arr.append(np.fromiter(map(_time, c["arrival_time"]), np.int32))
+            dep.append(np.fromiter(map(_time, c["departure_time"]), np.int32))
+            seq.append(np.array(c["stop_sequence"], dtype=np.int64))
+        if trip:
+            model.set_stop_times(*map(np.concatenate, (trip, stop, arr, dep, seq)))
+        else:
+            model.set_stop_times([], [], [], [], [])
+
+    def _load_shapes(self, model):
+        shape_ids = model.shape_ids
+        shape, lat, lon, seq = [], [], [], []
+        columns = ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence")
+        for c in self.chunks("shapes.txt", columns):
+            shape.append(np.fromiter(map(shape_ids.intern, c["shape_id"]), np.int32))
+            lat.append(np.array(c["shape_pt_lat"], dtype=np.float64))
+            lon.append(np.array(c["shape_pt_lon"], dtype=np.float64))
+            seq.append(np.array(c["shape_pt_sequence"], dtype=np.int64))
+        if shape:
+            model.set_shape_points(*map(np.concatenate, (shape, lat, lon, seq)))
+
+
+def read_feed(path=DEFAULT_FEED, shapes=True) -> FeedModel:
+    with GTFSReader(path) as reader:
+        return reader.load_model(shapes=shapes)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FEED
+    with GTFSReader(path) as reader:
+        model = reader.model
+        print(f"{path}: {', '.join(reader.members)}")
+        print(
+            f"{len(model.stop_ids)} stops, {len(model.route_ids)} routes, "
+            f"{model.num_trips} trips, {model.num_stop_times} stop_times, "
+            f"{len(model.shape_ids)} shapes / {len(model.shape_lat)} points, "
+            f"{len(reader.calendar)} calendar / "
+            f"{len(reader.calendar_dates)} calendar_dates rows"
+        )
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+gtfs_time.py
+
+Times as integer seconds since the start of the service day, the one
+representation used wherever times are compared, sorted or searched. Values
+of 24:00:00 and later are trips running past midnight on the service day
+they started on.
+
+  - parse_time("25:10:00") → 90600     ("HH:MM" is accepted too)
+  - format_time(90600) → "25:10:00"
+  - parse_12h("1:10AM") → 4200         (the timetable cells on the website)
+  - hhmm(90600) → "2510"               (trip_id suffixes)
+  - unwrap_midnight([..., 23:50, 00:20]) → [..., 23:50, 24:20]
+
+  usage: gtfs_time.py   (round-trips every minute of a 48 h service day)
+"""
+
+from functools import lru_cache
+
+DAY = 24 * 3600
+
+
+def parse_time(value) -> int:
+    """ "HH:MM" or "HH:MM:SS" (hours may exceed 23) → seconds since service day
+    start. Values already in seconds are passed through."""
+    if not isinstance(value, str):
+        return int(value)
+    parts = value.split(":")
+    secs = int(parts[0]) * 3600 + int(parts[1]) * 60
+    if len(parts) > 2:
+        secs += int(parts[2])
+    return secs
+
+
+# Feeds repeat the same few thousand times, so formatting is memoised
+@lru_cache(maxsize=4096)
+def format_time(secs: int, seconds: bool = True) -> str:
+    """Seconds since service day start → "HH:MM:SS" (or "HH:MM")."""
+    h, rem = divmod(int(secs), 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}" if seconds else f"{h:02d}:{m:02d}"
+
+
+def parse_12h(text: str) -> int:
+    """ "h:MMAM" / "h:MMPM" → seconds since midnight."""
+    text = text.strip().upper()
+    h, m = text[:-2].split(":")
+    h = int(h) % 12 + (12 if text.endswith("PM") else 0)
+    return h * 3600 + int(m) * 60
+
+
+def hhmm(secs: int) -> str:
+    return format_time(secs, seconds=False).replace(":", "")
+
+
+def unwrap_midnight(times):
+    """Clock times of one trip with 24 h added from the first one that falls
+    more than 12 h behind its predecessor, i.e. where the trip crosses
+    midnight. Smaller steps back are left for the caller to sort out."""
+    out, offset = [], 0
+    for t in times:
+        if out and t + offset < out[-1] - DAY // 2:
+            offset += DAY
+        out.append(t + offset)
+    return out
+
+
+if __name__ == "__main__":
+    for secs in range(0, 2 * DAY, 60):
+        assert parse_time(format_time(secs)) == secs
+        assert parse_time(format_time(secs, seconds=False)) == secs
+    assert parse_12h("12:05AM") == 300 and parse_12h("12:05PM") == 12 * 3600 + 300
+    assert unwrap_midnight([parse_12h("11:30PM"), parse_12h("1:10AM")]) == [
+        parse_time("23:30"),
+        parse_time("25:10"),
+    ]
+    print("ok")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+position_engine.py
+
+Answer "where is trip X at time t?" and "where are all buses at time t?" in
+NumPy batches. Built once from a FeedModel with shapes loaded:
+
+  - shape_dist / shape_rtime = cumulative metres and routed seconds per shape
+                               vertex (BRouter "times" where the GeoJSON has a
+                               complete array, otherwise distance-scaled)
+  - st_anchor                = shape vertex each stop_time projects onto,
+                               never moving backwards along the shape
+  - interval index           = trips bucketed by the BIN_SECONDS slices of the
+                               service day they run in
+
+Within a stop-to-stop leg progress follows routed time, so buses slow down
+where BRouter expects them to. Trips without a shape move in a straight line
+between their stops.
+
+Blank (non-timepoint) stop_times, common in feeds read with gtfs_reader.py,
+are filled first: a row with only one of arrival / departure uses it for
+both, and rows with neither are interpolated by distance (along the shape,
+or straight-line between stops) between the timed rows either side. A trip
+without times at its first and last stop is rejected with a ValueError.
+
+  usage: position_engine.py [HH:MM]
+"""
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from feed_model import NO_ID, NO_TIME, FeedModel
+from gtfs_time import parse_time
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_SPEED_MPS = 20.0  # Used to scale distance when a shape has no BRouter times
+SPAN = 1 << 20  # Seconds; larger than any service day, used to key rows by trip
+BIN_SECONDS = 300
+
+
+def cumulative_distance(lon, lat):
+    """Cumulative haversine distance in metres along a polyline."""
+    lon, lat = np.radians(lon), np.radians(lat)
+    dlat, dlon = np.diff(lat), np.diff(lon)
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    )
+    seg = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return np.concatenate([[0.0], np.cumsum(seg)])
+
+
+def bearing(lon0, lat0, lon1, lat1):
+    """Initial bearing in degrees clockwise from north."""
+    lon0, lat0, lon1, lat1 = map(np.radians, (lon0, lat0, lon1, lat1))
+    dlon = lon1 - lon0
+    y = np.sin(dlon) * np.cos(lat1)
+    x = np.cos(lat0) * np.sin(lat1) - np.sin(lat0) * np.cos(lat1) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def brouter_properties(fp):
+    with open(fp, "r", encoding="utf-8") as f:
+        return json.load(f)["features"][0]["properties"]
+
+
+def routed_times(props, dist):
+    """Per-vertex cumulative routed seconds from BRouter GeoJSON properties."""
+    times = props.get("times")
+    if times is not None and len(times) == len(dist):
+        return np.maximum.accumulate(np.asarray(times, dtype=np.float64))
+    # Straight-line legs leave BRouter's times one short; fall back to the
+    # routed total spread evenly over distance
+    total = float(props.get("total-time") or 0) or dist[-1] / DEFAULT_SPEED_MPS
+    return dist * (total / dist[-1]) if dist[-1] > 0 else dist.copy()
+
+
+def anchor_stops(lon, lat, stop_lon, stop_lat):
+    """Index of the vertex each stop projects onto, in order along the line."""
+    anchors = np.zeros(len(stop_lon), dtype=np.int64)
+    start = 0
+    for i, (x, y) in enumerate(zip(stop_lon, stop_lat)):
+        kx = np.cos(np.radians(y))
+        d2 = ((lon[start:] - x) * kx) ** 2 + (lat[start:] - y) ** 2
+        start += int(np.argmin(d2))
+        anchors[i] = start
+    return anchors
+
+
+def fill_times(model: FeedModel, st_dist):
+    """(arrival, departure) of every stop_time with blank times filled in.
+
+    st_dist is the distance along the trip's shape of each row, NaN for rows
+    of unshaped trips, which fall back to straight-line distance."""
+    m = model
+    arrival = np.where(m.st_arrival == NO_TIME, m.st_departure, m.st_arrival)
+    departure = np.where(m.st_departure == NO_TIME, m.st_arrival, m.st_departure)
+    blank = departure == NO_TIME
+    if not blank.any():
+        return arrival, departure
+
+    ends = np.concatenate([m.trip_st[:-1], m.trip_st[1:] - 1])
+    ends = ends[np.repeat(np.diff(m.trip_st) > 0, 2)]
+    if blank[ends].any():
+        trip = m.st_trip[ends[blank[ends]][0]]
+        raise ValueError(
+            f"trip {m.trip_ids[trip]} has no time at its first or last stop"
+        )
+
+    # Only differences within a trip are used, so one running total over
+    # every row serves all the unshaped trips
+    straight = cumulative_distance(m.stop_lon[m.st_stop], m.stop_lat[m.st_stop])
+    dist = np.where(np.isnan(st_dist), straight, st_dist)
+    rows = np.flatnonzero(blank)
+    timed = np.flatnonzero(~blank)
+    # Trips start and end timed, so the timed rows either side of a blank
+    # row belong to its trip
+    before = timed[np.searchsorted(timed, rows) - 1]
+    after = timed[np.searchsorted(timed, rows)]
+    span = dist[after] - dist[before]
+    f = np.where(
+        span > 0,
+        (dist[rows] - dist[before]) / np.where(span > 0, span, 1.0),
+        (rows - before) / (after - before),
+    )
+    t0, t1 = departure[before], arrival[after]
+    filled = np.round(t0 + f * (t1 - t0)).astype(arrival.dtype)
+    arrival[rows] = departure[rows] = filled
+    return arrival, departure
+
+
+class PositionEngine:
+    def __init__(self, model: FeedModel, shapes_dir=None):
+        self.model = m = model
+
+        # Per-vertex distance and routed time along each shape
+        self.shape_dist = np.zeros(len(m.shape_lat))
+        self.shape_rtime = np.zeros(len(m.shape_lat))
+        for s, shape_id in enumerate(m.shape_ids):
+            pts = m.shape_slice(s)
+            if pts.stop - pts.start < 2:
+                continue
+            dist = cumulative_distance(m.shape_lon[pts], m.shape_lat[pts])
+            self.shape_dist[pts] = dist
+            fp = os.path.join(shapes_dir, f"{shape_id}.geojson") if shapes_dir else ""
+            if os.path.exists(fp):
+                self.shape_rtime[pts] = routed_times(brouter_properties(fp), dist)
+            else:
+                self.shape_rtime[pts] = dist / DEFAULT_SPEED_MPS
+        self.shape_len = np.diff(m.shape_pt)
+        self.shape_key = (
+            np.repeat(np.arange(len(m.shape_ids)), self.shape_len) * float(SPAN)
+            + self.shape_rtime
+        )
+
+        # Stop anchors; trips sharing a shape and stop pattern share the work
+        self.st_anchor = np.full(m.num_stop_times, NO_ID, dtype=np.int64)
+        patterns = {}
+        for trip in range(m.num_trips):
+            shape = int(m.trip_shape[trip])
+            if shape == NO_ID or self.shape_len[shape] < 2:
+                continue
+            rows = m.trip_slice(trip)
+            key = (shape, m.st_stop[rows].tobytes())
+            if key not in patterns:
+                pts = m.shape_slice(shape)
+                stops = m.st_stop[rows]
+                patterns[key] = pts.start + anchor_stops(
+                    m.shape_lon[pts],
+                    m.shape_lat[pts],
+                    m.stop_lon[stops],
+                    m.stop_lat[stops],
+                )
+            self.st_anchor[rows] = patterns[key]
+        anchored = self.st_anchor != NO_ID
+        # Only anchored rows index the shape arrays, which are empty without
+        # shapes.txt
+        self.st_dist = np.full(m.num_stop_times, np.nan)
+        self.st_rtime = np.full(m.num_stop_times, np.nan)
+        self.st_dist[anchored] = self.shape_dist[self.st_anchor[anchored]]
+        self.st_rtime[anchored] = self.shape_rtime[self.st_anchor[anchored]]
+
+        self.st_arrival, self.st_departure = fill_times(m, self.st_dist)
+        self.st_key = m.st_trip.astype(np.int64) * SPAN + self.st_departure
+        self.trip_start = self.st_departure[m.trip_st[:-1]]
+        self.trip_end = self.st_arrival[np.maximum(m.trip_st[1:] - 1, 0)]
+        self._build_interval_index()
+
+    def _build_interval_index(self):
+        """CSR map from service-day time bin to the trips running in it."""
+        first = self.trip_start // BIN_SECONDS
+        last = self.trip_end // BIN_SECONDS
+        spans = np.maximum(last - first + 1, 0)
+        trips = np.repeat(np.arange(len(first)), spans)
+        bins = np.repeat(first, spans) + (
+            np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        )
+        order = np.argsort(bins, kind="stable")
+        self.bin_trips = trips[order].astype(np.int32)
+        n = int(bins.max()) + 2 if len(bins) else 1
+        self.bin_pt = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(bins, minlength=n), out=self.bin_pt[1:])
+
+    def active(self, t: int, mask=None):
+        """Trips running at service-day second t, optionally limited by a trip mask."""
+        b = t // BIN_SECONDS
+        if b < 0 or b + 1 >= len(self.bin_pt):
+            return np.zeros(0, dtype=np.int32)
+        trips = self.bin_trips[self.bin_pt[b] : self.bin_pt[b + 1]]
+        keep = (self.trip_start[trips] <= t) & (t <= self.trip_end[trips])
+        if mask is not None:
+            keep &= mask[trips]
+        return trips[keep]
+
+    def positions(self, trips, t):
+        """Vectorised (lon, lat, bearing, metres along shape) for trips at t.
+
+        t is a scalar or an array matching trips, in service-day seconds.
+        """
+        m = self.model
+        trips = np.asarray(trips, dtype=np.int64)
+        t = np.broadcast_to(np.asarray(t, dtype=np.int64), trips.shape)
+        first, last = m.trip_st[trips], m.trip_st[trips + 1] - 1
+        k = np.searchsorted(self.st_key, trips * SPAN + t, "right") - 1
+        k = np.clip(k, first, np.maximum(last - 1, first))
+        k1 = np.minimum(k + 1, last)
+
+        t0, t1 = self.st_departure[k], self.st_arrival[k1]
+        f = np.clip((t - t0) / np.maximum(t1 - t0, 1), 0.0, 1.0)
+
+        s0, s1 = m.st_stop[k], m.st_stop[k1]
+        lon = m.stop_lon[s0] + f * (m.stop_lon[s1] - m.stop_lon[s0])
+        lat = m.stop_lat[s0] + f * (m.stop_lat[s1] - m.stop_lat[s0])
+        head = bearing(m.stop_lon[s0], m.stop_lat[s0], m.stop_lon[s1], m.stop_lat[s1])
+        dist = np.full(len(trips), np.nan)
+
+        has = self.st_anchor[k] != NO_ID
+        if has.any():
+            k, k1, f = k[has], k1[has], f[has]
+            sh = m.trip_shape[trips[has]]
+            rt = self.st_rtime[k] + f * (self.st_rtime[k1] - self.st_rtime[k])
+            j = np.searchsorted(self.shape_key, sh * float(SPAN) + rt, "right") - 1
+            j = np.clip(j, m.shape_pt[sh], m.shape_pt[sh + 1] - 2)
+            v0, v1 = self.shape_rtime[j], self.shape_rtime[j + 1]
+            g = np.clip((rt - v0) / np.where(v1 > v0, v1 - v0, 1.0), 0.0, 1.0)
+            lon0, lat0 = m.shape_lon[j], m.shape_lat[j]
+            lon1, lat1 = m.shape_lon[j + 1], m.shape_lat[j + 1]
+            lon[has] = lon0 + g * (lon1 - lon0)
+            lat[has] = lat0 + g * (lat1 - lat0)
+            head[has] = bearing(lon0, lat0, lon1, lat1)
+            dist[has] = self.shape_dist[j] + g * (
+                self.shape_dist[j + 1] - self.shape_dist[j]
+            )
+        return lon, lat, head, dist
+
+    def positions_at(self, t: int, mask=None):
+        """(trips, lon, lat, bearing, metres along shape) for every trip running at t."""
+        trips = self.active(t, mask)
+        return (trips, *self.positions(trips, t))
+
+
+if __name__ == "__main__":
+    from gen_gtfs import ROUTES, STOPS, TRIPS
+
+    model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+    model.load_shapes()
+    engine = PositionEngine(model, os.path.join(script_dir, "shapes"))
+
+    t = parse_time(sys.argv[1]) if len(sys.argv) > 1 else 9 * 3600
+    trips, lon, lat, head, dist = engine.positions_at(t)
+    for i, trip in enumerate(trips):
+        print(
+            f"{model.trip_ids[trip]:45} {lat[i]:10.5f} {lon[i]:11.5f} "
+            f"{head[i]:5.0f}° {dist[i] / 1000:7.1f} km"
+        )
+
+    n = 1_000_000
+    rng = np.random.default_rng(0)
+    qt = rng.integers(0, model.num_trips, n)
+    qs = rng.integers(engine.trip_start[qt], engine.trip_end[qt] + 1)
+    start = time.perf_counter()
+    engine.positions(qt, qs)
+    elapsed = time.perf_counter() - start
+    print(f"{n / elapsed:,.0f} position evaluations/s", file=sys.stderr)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+records.py
+
+Compact row types for the larger GTFS tables: Stop, Route, Trip, StopTime
+and ShapePoint. Each is a __slots__ class with one slot per column instead
+of a dict carrying the same key strings on every row, so a row costs a
+fraction of the memory of the dict it replaces.
+
+Records still read like the dict rows the rest of the code expects:
+row["stop_id"], row.get("shape_id"), iteration over column names and
+{**row}. A slot holding None behaves as a missing key.
+
+  usage: records.py   (prints per-row sizes against dict rows)
+"""
+
+from collections.abc import Mapping
+from operator import attrgetter
+
+from gtfs_time import format_time
+
+# Typed columns of the GTFS tables. Time columns hold int seconds in memory
+# and are formatted as HH:MM:SS on the way out to CSV.
+TIME_COLUMNS = {"arrival_time", "departure_time", "start_time", "end_time"}
+DATE_COLUMNS = {"date", "start_date", "end_date", "feed_start_date", "feed_end_date"}
+FLOAT_COLUMNS = {
+    "stop_lat",
+    "stop_lon",
+    "shape_pt_lat",
+    "shape_pt_lon",
+    "shape_dist_traveled",
+}
+
+
+def csv_time(value):
+    """A time column's CSV text: int seconds as HH:MM:SS, anything else as is."""
+    return format_time(value) if isinstance(value, int) else value
+
+
+class Record(Mapping):
+    __slots__ = ()
+
+    @classmethod
+    def from_mapping(cls, row):
+        """The record for a dict row; keys that aren't columns are dropped."""
+        return cls(*map(row.get, cls.__slots__))
+
+    @classmethod
+    def csv_row(cls):
+        """A function from a record to its CSV column values."""
+        get = attrgetter(*cls.__slots__)
+        times = [i for i, k in enumerate(cls.__slots__) if k in TIME_COLUMNS]
+        if not times:
+            return get
+
+        def row(record):
+            values = list(get(record))
+            for i in times:
+                values[i] = csv_time(values[i])
+            return values
+
+        return row
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (k for k in self.__slots__ if getattr(self, k) is not None)
+
+    def __len__(self):
+        return sum(getattr(self, k) is not None for k in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Stop(Record):
+    __slots__ = ("stop_id", "stop_name", "stop_desc", "stop_lat", "stop_lon")
+
+    def __init__(
+        self, stop_id, stop_name=None, stop_desc=None, stop_lat=None, stop_lon=None
+    ):
+        self.stop_id = stop_id
+        self.stop_name = stop_name
+        self.stop_desc = stop_desc
+        self.stop_lat = stop_lat
+        self.stop_lon = stop_lon
+
+
+class Route(Record):
+    __slots__ = (
+        "route_id",
+        "agency_id",
+        "route_long_name",
+        "route_desc",
+        "route_type",
+    )
+
+    def __init__(
+        self,
+        route_id,
+        agency_id=None,
+        route_long_name=None,
+        route_desc=None,
+        route_type=None,
+    ):
+        self.route_id = route_id
+        self.agency_id = agency_id
+        self.route_long_name = route_long_name
+        self.route_desc = route_desc
+        self.route_type = route_type
+
+
+class Trip(Record):
+    __slots__ = (
+        "route_id",
+        "service_id",
+        "trip_id",
+        "trip_short_name",
+        "direction_id",
+        "block_id",
+        "shape_id",
+        "bikes_allowed",
+    )
+
+    def __init__(
+        self,
+        route_id,
+        service_id,
+        trip_id,
+        trip_short_name=None,
+        direction_id=None,
+        block_id=None,
+        shape_id=None,
+        bikes_allowed=None,
+    ):
+        self.route_id = route_id
+        self.service_id = service_id
+        self.trip_id = trip_id
+        self.trip_short_name = trip_short_name
+        self.direction_id = direction_id
+        self.block_id = block_id
+        self.shape_id = shape_id
+        self.bikes_allowed = bikes_allowed
+
+
+class StopTime(Record):
+    __slots__ = (
+        "trip_id",
+        "arrival_time",
+        "departure_time",
+        "stop_id",
+        "stop_sequence",
+    )
+
+    def __init__(self, trip_id, arrival_time, departure_time, stop_id, stop_sequence):
+        self.trip_id = trip_id
+        self.arrival_time = arrival_time
+        self.departure_time = departure_time
+        self.stop_id = stop_id
+        self.stop_sequence = stop_sequence
+
+
+class ShapePoint(Record):
+    __slots__ = ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence")
+
+    def __init__(self, shape_id, shape_pt_lat, shape_pt_lon, shape_pt_sequence):
+        self.shape_id = shape_id
+        self.shape_pt_lat = shape_pt_lat
+        self.shape_pt_lon = shape_pt_lon
+        self.shape_pt_sequence = shape_pt_sequence
+
+
+if __name__ == "__main__":
+    import sys
+
+    from gen_gtfs import build_tables
+
+    tables = build_tables()
+    for filename, rows in tables.items():
+        rows = list(rows)  # shapes.txt comes as feed_archive.ChunkedRows
+        # Not isinstance(..., Record): run as a script, this module is __main__
+        if rows and not isinstance(rows[0], dict):
+            record = sys.getsizeof(rows[0])
+            as_dict = sys.getsizeof(dict(rows[0]))
+            print(
+                f"{filename}: {len(rows)} × {type(rows[0]).__name__}, "
+                f"{record} bytes per row vs {as_dict} as a dict"
+            )
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+scrape_daemon.py
+
+Poll concordcoachlines.com on a schedule and rebuild a candidate feed only
+when the published schedules or stops actually change.
+
+Each poll makes conditional requests (If-None-Match / If-Modified-Since) for
+every route page in cc_trip_scraper.ROUTE_ID_MAP and for the stop sitemap,
+so an unchanged site costs a handful of 304s and no parsing at all. A page
+that does come back is hashed raw first; only if the bytes differ is it
+parsed and its normalised content hashed:
+
+  - routes: the text of each <div class="schedule"> block, whitespace-collapsed
+  - stops:  name, description and map embed of each stop page whose sitemap
+            <lastmod> moved
+
+When a normalised hash changes, the changed routes are re-scraped and the
+latest scrape of every route and stop is kept in STATE_DIR/scraped/. The
+candidate feed replaces the TRIPS of every route whose latest scrape
+differs from gen_gtfs.py (not just the routes that changed in this poll, so
+earlier changes that haven't been copied over yet stay in), applies every
+scraped stop to STOPS, and is validated and written to STATE_DIR/candidate/
+along with those routes' scraped TRIPS as Python for review. gen_gtfs.py
+stays the source of truth; the candidate and its diff against the
+published zip say what to copy over.
+
+State (validators and hashes) lives in STATE_DIR/state.json; every poll
+appends its timings and change summary to STATE_DIR/runs.jsonl.
+
+  usage: scrape_daemon.py [--once] [--interval SECONDS] [--state-dir DIR]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+from cc_stop_scraper import (
+    SITEMAP_URL,
+    extract_iframe_src,
+    extract_metadata,
+    parse_coords_from_embed,
+)
+from cc_trip_scraper import HEADERS, ROUTE_ID_MAP, emit_python, scrape_trips
+from gen_gtfs import STOPS, TRIPS, build_tables, feed_path, script_dir, write_feed
+from gtfs_time import format_time
+from stop_index import StopIndex
+from validate_gtfs import ERROR, print_problems, source_shape_ids, validate
+
+STATE_DIR = os.path.join(script_dir, ".scrape_state")
+DEFAULT_INTERVAL = 6 * 3600
+
+
+# ── HTTP ──
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def conditional_get(session, url, cache):
+    """The body of url if it changed since the last poll, else None.
+
+    cache[url] keeps the response's ETag / Last-Modified and a hash of its
+    body, so servers that ignore validators and answer 200 with identical
+    bytes are caught without parsing either."""
+    entry = cache.get(url, {})
+    headers = dict(HEADERS)
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    resp = session.get(url, headers=headers, timeout=60)
+    if resp.status_code == 304:
+        return None
+    resp.raise_for_status()
+    body = resp.text
+    digest = _digest(body)
+    unchanged = digest == entry.get("body")
+    cache[url] = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "body": digest,
+    }
+    return None if unchanged else body
+
+
+# ── NORMALISED HASHES ──
+def schedule_digest(soup) -> str:
+    """Hash of a route page's schedule tables, independent of the markup
+    around them (nonces, cache-busters, menus)."""
+    blocks = (" ".join(s.get_text(" ").split()) for s in soup.select("div.schedule"))
+    return _digest("\n".join(blocks))
+
+
+def sitemap_lastmods(xml: str) -> dict[str, str]:
+    """{stop page URL: <lastmod>} from the stop sitemap."""
+    out = {}
+    for url in ET.fromstring(xml).findall(".//{*}url"):
+        loc = url.findtext("{*}loc")
+        if loc and urlparse(loc).path.startswith("/stop/"):
+            out[loc] = url.findtext("{*}lastmod") or ""
+    return out
+
+
+def parse_stop(html: str):
+    """(name, desc, embed src) of a stop page."""
+    name, desc = extract_metadata(html)
+    return name, desc, extract_iframe_src(html)
+
+
+# ── POLL ──
+def poll(session, state):
+    """One pass over the site. Returns (changed routes {route_id: (url, soup)},
+    changed stops {url: (name, desc, src)}, requests made, 304s + identical
+    bodies). state is updated in place."""
+    http = state.setdefault("http", {})
+    routes = state.setdefault("routes", {})
+    stops = state.setdefault("stops", {})
+    lastmods = state.setdefault("lastmod", {})
+    changed_routes, changed_stops = {}, {}
+    requests_made = unchanged = 0
+
+    for url, route_id in ROUTE_ID_MAP.items():
+        requests_made += 1
+        body = conditional_get(session, url, http)
+        if body is None:
+            unchanged += 1
+            continue
+        soup = BeautifulSoup(body, "html.parser")
+        digest = schedule_digest(soup)
+        if digest != routes.get(route_id):
+            routes[route_id] = digest
+            changed_routes[route_id] = (url, soup)
+
+    requests_made += 1
+    sitemap = conditional_get(session, SITEMAP_URL, http)
+    if sitemap is None:
+        unchanged += 1
+    else:
+        for url, lastmod in sitemap_lastmods(sitemap).items():
+            if lastmods.get(url) == lastmod and url in stops:
+                continue
+            requests_made += 1
+            body = conditional_get(session, url, http)
+            lastmods[url] = lastmod
+            if body is None:
+                unchanged += 1
+                continue
+            try:
+                stop = parse_stop(body)
+            except ValueError as e:
+                print(f"ERROR processing {url}: {e}", file=sys.stderr)
+                continue
+            digest = _digest(json.dumps(stop))
+            if digest != stops.get(url):
+                stops[url] = digest
+                changed_stops[url] = stop
+    return changed_routes, changed_stops, requests_made, unchanged
+
+
+# ── REBUILD ──
+def _departures(trips):
+    return Counter(
+        (t["direction_id"], format_time(t["stop_times"][0][0], seconds=False))
+        for t in trips
+        if t["stop_times"]
+    )
+
+
+def trip_changes(route_id, scraped):
+    """{"added": [...], "removed": [...]} first departures (direction/HH:MM)
+    of the scraped trips against the route's current TRIPS."""
+    before = _departures(t for t in TRIPS if t["route_id"] == route_id)
+    after = _departures(scraped)
+    return {
+        "added": sorted(f"{d}/{hm}" for d, hm in (after - before).elements()),
+        "removed": sorted(f"{d}/{hm}" for d, hm in (before - after).elements()),
+    }
+
+
+def merge_stops(changed_stops):
+    """STOPS with scraped name/desc/coordinates applied, matched on name, and
+    new stops appended. Returns (stops, summary lines)."""
+    by_name = {s["stop_name"]: dict(s) for s in STOPS}
+    summary = []
+    for url, (name, desc, src) in sorted(changed_stops.items()):
+        try:
+            lat, lon = parse_coords_from_embed(src)
+        except ValueError as e:
+            summary.append(f"{name}: no coordinates ({e})")
+            continue
+        stop = by_name.get(name)
+        if stop is None:
+            # Keyed on the stop page, so the id is the same on every poll
+            by_name[name] = {
+                "stop_id": f"STOP-{_digest(url)[:12]}",
+                "stop_name": name,
+                "stop_desc": desc,
+                "stop_lat": lat,
+                "stop_lon": lon,
+            }
+            summary.append(f"{name}: new stop")
+            continue
+        fields = [
+            k
+            for k, v in (("stop_desc", desc), ("stop_lat", lat), ("stop_lon", lon))
+            if stop.get(k) != v
+        ]
+        if fields:
+            stop.update(stop_desc=desc, stop_lat=lat, stop_lon=lon)
+            summary.append(f"{name}: {', '.join(fields)} changed")
+    return list(by_name.values()), summary
+
+
+def _published(trips):
+    """What the website says about a route's trips, comparable between a
+    scrape and TRIPS (service_id and bikes_allowed aren't on the page)."""
+    return sorted(
+        (
+            t["trip_id"],
+            t["direction_id"],
+            t["trip_short_name"],
+            t.get("shape_id"),
+            [tuple(st) for st in t["stop_times"]],
+        )
+        for t in trips
+    )
+
+
+def load_scraped(state_dir):
+    """({route_id: scraped trips}, {stop URL: (name, desc, src)}) saved by
+    earlier runs."""
+    routes = {}
+    routes_dir = os.path.join(state_dir, "scraped", "routes")
+    if os.path.isdir(routes_dir):
+        for name in os.listdir(routes_dir):
+            with open(os.path.join(routes_dir, name), encoding="utf-8") as f:
+                trips = json.load(f)
+            for trip in trips:
+                trip["stop_times"] = [tuple(st) for st in trip["stop_times"]]
+            routes[name.removesuffix(".json")] = trips
+    stops = load_state(os.path.join(state_dir, "scraped", "stops.json"))
+    return routes, {url: tuple(stop) for url, stop in stops.items()}
+
+
+def save_scraped(state_dir, routes, stops):
+    routes_dir = os.path.join(state_dir, "scraped", "routes")
+    os.makedirs(routes_dir, exist_ok=True)
+    for route_id, trips in routes.items():
+        save_state(trips, os.path.join(routes_dir, f"{route_id}.json"))
+    save_state(stops, os.path.join(state_dir, "scraped", "stops.json"))
+
+
+def rebuild(changed_routes, changed_stops, out_dir, scraped_routes, scraped_stops):
+    """Scrape the changed routes into scraped_routes and add changed_stops to
+    scraped_stops (both updated in place), write the candidate feed and its
+    review files to out_dir, and return the run's change summary."""
+    os.makedirs(out_dir, exist_ok=True)
+    summary = {"routes": {}, "stops": []}
+    index = StopIndex(STOPS)
+    for route_id, (url, soup) in sorted(changed_routes.items()):
+        scraped_routes[route_id] = scrape_trips(url, route_id, soup, index)
+    scraped_stops.update(changed_stops)
+
+    for name in os.listdir(out_dir):
+        if name.endswith("_trips.py"):
+            os.remove(os.path.join(out_dir, name))
+    replaced = {}
+    for route_id, scraped in sorted(scraped_routes.items()):
+        current = [t for t in TRIPS if t["route_id"] == route_id]
+        if _published(scraped) == _published(current):
+            continue
+        replaced[route_id] = scraped
+        summary["routes"][route_id] = trip_changes(route_id, scraped)
+        with open(f"{out_dir}/{route_id}_trips.py", "w", encoding="utf-8") as f:
+            with contextlib.redirect_stdout(f):
+                emit_python(scraped)
+
+    # Scraped shape_ids that have no routed geometry yet are dropped from the
+    # candidate and listed, rather than failing the whole build
+    shapes = source_shape_ids()
+    trips = [t for t in TRIPS if t["route_id"] not in replaced]
+    for route_trips in replaced.values():
+        for trip in route_trips:
+            if trip["shape_id"] not in shapes:
+                summary.setdefault("unrouted_shapes", set()).add(trip["shape_id"])
+                trip = {k: v for k, v in trip.items() if k != "shape_id"}
+            trips.append(trip)
+    summary["unrouted_shapes"] = sorted(summary.get("unrouted_shapes", ()))
+    summary["stop_titles"] = index.report()
+    stops, summary["stops"] = merge_stops(scraped_stops)
+
+    tables = build_tables(trips=trips, stops=stops)
+    problems = validate(tables, shapes)
+    summary["errors"] = sum(severity == ERROR for severity, *_ in problems)
+    summary["warnings"] = len(problems) - summary["errors"]
+    lines = io.StringIO()
+    print_problems(problems, lines)
+    summary["problems"] = lines.getvalue().splitlines()
+    candidate = os.path.join(out_dir, "concord_coach_gtfs")
+    write_feed(tables, candidate)
+
+    if os.path.exists(f"{feed_path}.zip"):
+        from diff_gtfs import diff_feeds
+
+        counts = Counter(
+            f"{table} {change}"
+            for table, change, *_ in diff_feeds(f"{feed_path}.zip", f"{candidate}.zip")
+        )
+        summary["diff"] = dict(sorted(counts.items()))
+    return summary
+
+
+# ── MAIN ──
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def run_once(session, state_dir):
+    """Poll, rebuild if anything changed, and append the run to runs.jsonl."""
+    state_path = os.path.join(state_dir, "state.json")
+    state = load_state(state_path)
+    scraped_routes, scraped_stops = load_scraped(state_dir)
+    started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    t0 = time.perf_counter()
+    run = {"started": started}
+    try:
+        changed_routes, changed_stops, made, unchanged = poll(session, state)
+        run["timings"] = {"poll": round(time.perf_counter() - t0, 3)}
+        run.update(requests=made, unchanged=unchanged)
+        run["changed_routes"] = sorted(changed_routes)
+        run["changed_stops"] = len(changed_stops)
+        if changed_routes or changed_stops:
+            t1 = time.perf_counter()
+            out = io.StringIO()
+            # build/validate chatter goes to the run's log entry, not the
+            # console, including when the rebuild fails
+            try:
+                with contextlib.redirect_stderr(out):
+                    run["summary"] = rebuild(
+                        changed_routes,
+                        changed_stops,
+                        os.path.join(state_dir, "candidate"),
+                        scraped_routes,
+                        scraped_stops,
+                    )
+            finally:
+                run["log"] = out.getvalue().splitlines()
+            run["timings"]["rebuild"] = round(time.perf_counter() - t1, 3)
+            save_scraped(state_dir, scraped_routes, scraped_stops)
+        # Hashes and scrapes are only committed once their rebuild has gone
+        # through, so a failed run is retried on the next poll
+        save_state(state, state_path)
+    except Exception as e:
+        run["error"] = f"{type(e).__name__}: {e}"
+    run.setdefault("timings", {})["total"] = round(time.perf_counter() - t0, 3)
+    with open(os.path.join(state_dir, "runs.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def print_run(run):
+    if "error" in run:
+        print(f"{run['started']}: {run['error']}", file=sys.stderr)
+        return
+    line = (
+        f"{run['started']}: {run['requests']} requests, {run['unchanged']} "
+        f"unchanged, {run['timings']['total']:.2f}s"
+    )
+    summary = run.get("summary")
+    if summary:
+        line += f"; rebuilt for {', '.join(run['changed_routes']) or 'stops'}"
+        line += f" ({summary['errors']} errors, {summary['warnings']} warnings)"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="seconds between polls (default: %(default)s)",
+    )
+    parser.add_argument("--state-dir", default=STATE_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    with requests.Session() as session:
+        while True:
+            started = time.monotonic()
+            run = run_once(session, args.state_dir)
+            print_run(run)
+            if args.once:
+                sys.exit(1 if "error" in run else 0)
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+service_profile.py
+
+Count the trips the feed runs per day, week and hour across its whole
+calendar window, per route and per stop.
+
+The calendar is expanded once into a date × service_id activity matrix:
+calendar.txt rows become a date-range mask ANDed with a weekday lookup, and
+calendar_dates.txt additions and removals are scattered into it. Trip
+counts per service_id (by route, by stop called at, by departure hour) are
+bincounts over the FeedModel columns. Every profile is then one matrix
+product, activity (days × services) @ counts (services × columns), so the
+whole window costs a handful of array operations however many days it spans:
+
+  - daily_routes  trips per date and route_id (plus a total)
+  - daily_stops   trips calling at each stop_id per date
+  - weekly_routes daily_routes summed over Monday-to-Sunday weeks
+  - hourly        trips per date by the hour they leave their first stop
+                  (service-day hours, so 24 and up are after midnight)
+
+Profiles are written as wide CSV or Parquet tables to
+concord_coach_gtfs_profiles/.
+
+  usage: service_profile.py [--format csv|parquet]
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from feed_model import WEEKDAYS
+
+
+def _day(yyyymmdd) -> np.datetime64:
+    v = str(int(yyyymmdd))
+    return np.datetime64(f"{v[:4]}-{v[4:6]}-{v[6:]}", "D")
+
+
+def activity_matrix(calendar, calendar_dates, service_ids):
+    """(dates, active): the datetime64[D] days from the first calendar
+    start_date to the last end_date (or across calendar_dates, without a
+    calendar), and a bool matrix of which of service_ids (in order) runs on
+    each."""
+    column = {sid: j for j, sid in enumerate(service_ids)}
+    if calendar:
+        first = min(_day(c["start_date"]) for c in calendar)
+        last = max(_day(c["end_date"]) for c in calendar)
+    elif calendar_dates:
+        first = min(_day(cd["date"]) for cd in calendar_dates)
+        last = max(_day(cd["date"]) for cd in calendar_dates)
+    else:
+        return np.zeros(0, "datetime64[D]"), np.zeros((0, len(column)), bool)
+    dates = np.arange(first, last + 1, dtype="datetime64[D]")
+    # 1970-01-01 was a Thursday; Monday is 0 as in WEEKDAYS
+    weekday = (dates.astype(np.int64) + 3) % 7
+
+    active = np.zeros((len(dates), len(column)), dtype=bool)
+    for c in calendar:
+        j = column.get(c["service_id"])
+        if j is None:
+            continue
+        runs = np.array([bool(int(c[day])) for day in WEEKDAYS])
+        in_range = (dates >= _day(c["start_date"])) & (dates <= _day(c["end_date"]))
+        active[:, j] |= in_range & runs[weekday]
+
+    rows, cols, added = [], [], []
+    for cd in calendar_dates:
+        j = column.get(cd["service_id"])
+        i = (_day(cd["date"]) - first).astype(np.int64)
+        if j is not None and 0 <= i < len(dates):
+            rows.append(i)
+            cols.append(j)
+            added.append(int(cd["exception_type"]) == 1)
+    active[rows, cols] = added
+    return dates, active
+
+
+def service_counts(model):
+    """Trip counts per service (rows, in model.service_ids order):
+    {"routes": services × routes, "stops": services × stops,
+    "hours": services × departure hours}."""
+    n_services = len(model.service_ids)
+    service = model.trip_service.astype(np.int64)
+
+    def count(keys, n):
+        flat = np.bincount(keys, minlength=n_services * n)
+        return flat.reshape(n_services, n)
+
+    n_routes = len(model.route_ids)
+    routes = count(service * n_routes + model.trip_route, n_routes)
+
+    # A trip that calls twice at a stop (a layover) counts once there
+    n_stops = len(model.stop_ids)
+    calls = np.unique(model.st_trip.astype(np.int64) * n_stops + model.st_stop)
+    stops = count(service[calls // n_stops] * n_stops + calls % n_stops, n_stops)
+
+    has_times = model.trip_st[1:] > model.trip_st[:-1]
+    first = model.trip_st[:-1][has_times]
+    hour = model.st_departure[first] // 3600
+    n_hours = int(hour.max()) + 1 if len(hour) else 0
+    hours = count(service[has_times] * n_hours + hour, n_hours)
+    return {"routes": routes, "stops": stops, "hours": hours}
+
+
+def _weeks(dates, daily):
+    """(Monday of each week, daily summed per week)."""
+    monday = dates - ((dates.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    starts = np.flatnonzero(np.r_[True, monday[1:] != monday[:-1]])
+    return monday[starts], np.add.reduceat(daily, starts, axis=0)
+
+
+def build_profiles(model, calendar, calendar_dates):
+    """{profile: (index name, index labels, column labels, int matrix)}."""
+    dates, active = activity_matrix(calendar, calendar_dates, model.service_ids)
+    active = active.astype(np.int64)
+    counts = service_counts(model)
+
+    routes = list(model.route_ids)
+    daily_routes = active @ counts["routes"]
+    daily_routes = np.column_stack([daily_routes, daily_routes.sum(axis=1)])
+    weeks, weekly_routes = _weeks(dates, daily_routes)
+    hours = [f"{h:02d}" for h in range(counts["hours"].shape[1])]
+    return {
+        "daily_routes": ("date", dates, routes + ["total"], daily_routes),
+        "daily_stops": ("date", dates, list(model.stop_ids), active @ counts["stops"]),
+        "weekly_routes": ("week", weeks, routes + ["total"], weekly_routes),
+        "hourly": ("date", dates, hours, active @ counts["hours"]),
+    }
+
+
+def write_csv(profiles, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, (index_name, index, columns, values) in profiles.items():
+        with open(os.path.join(out_dir, f"{name}.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([index_name, *columns])
+            writer.writerows(
+                [label, *row] for label, row in zip(index.astype(str), values.tolist())
+            )
+
+
+def write_parquet(profiles, out_dir):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, (index_name, index, columns, values) in profiles.items():
+        table = pa.table(
+            {
+                index_name: pa.array(index, pa.date32()),
+                **{
+                    c: pa.array(values[:, j], pa.int32()) for j, c in enumerate(columns)
+                },
+            }
+        )
+        path = os.path.join(out_dir, f"{name}.parquet")
+        pq.write_table(table, path, compression="zstd")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from feed_model import FeedModel
+    from gen_gtfs import CALENDAR, CALENDAR_DATES, ROUTES, STOPS, TRIPS, feed_path
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    args = parser.parse_args()
+
+    model = FeedModel.from_trips(TRIPS, STOPS, ROUTES)
+    start = time.perf_counter()
+    profiles = build_profiles(model, CALENDAR, CALENDAR_DATES)
+    elapsed = time.perf_counter() - start
+
+    out_dir = f"{feed_path}_profiles"
+    {"csv": write_csv, "parquet": write_parquet}[args.format](profiles, out_dir)
+    _, dates, routes, daily = profiles["daily_routes"]
+    print(
+        f"{len(dates)} days ({dates[0]} to {dates[-1]}) in {elapsed * 1000:.1f} ms, "
+        f"written to {out_dir}/"
+    )
+    for route_id, total in zip(routes, daily.sum(axis=0)):
+        print(f"  {route_id:<20} {total:>8} trips, {total / len(dates):6.1f} per day")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+shape_stitcher.py
+
+Build shapes for new trip variants from geometry we already have, instead of
+routing them by hand in brouter-web.
+
+Every existing shape in shapes/ is split at its trips' stop projections into
+stop-to-stop segments keyed by (from_stop_id, to_stop_id), keeping BRouter's
+per-vertex times. A new stop sequence is assembled by chaining its segments
+and written as shapes/<shape_id>.geojson in the same layout BRouter exports.
+Only sequences with a segment we have never seen fall back to the manual
+path, for which the brouter-web URL is printed.
+
+  usage: shape_stitcher.py [--dry-run]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from feed_model import FeedModel
+from gen_brouter_urls import brouter_url
+from position_engine import PositionEngine, cumulative_distance
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+shapes_dir = os.path.join(script_dir, "shapes")
+
+
+def stop_sequence(trip):
+    """A trip's stop_ids in order, without repeated rows for a layover."""
+    stops = []
+    for _, sid in trip["stop_times"]:
+        if not stops or stops[-1] != sid:
+            stops.append(sid)
+    return stops
+
+
+class SegmentStore:
+    def __init__(self):
+        self.segments = {}  # (from_stop_id, to_stop_id) -> (lon, lat, times)
+
+    @classmethod
+    def from_engine(cls, engine: PositionEngine):
+        store = cls()
+        m = engine.model
+        for trip in range(m.num_trips):
+            rows = m.trip_slice(trip)
+            for r in range(rows.start, rows.stop - 1):
+                a, b = int(engine.st_anchor[r]), int(engine.st_anchor[r + 1])
+                key = (m.stop_ids[m.st_stop[r]], m.stop_ids[m.st_stop[r + 1]])
+                if a < 0 or b <= a or key[0] == key[1] or key in store.segments:
+                    continue
+                rtime = engine.shape_rtime[a : b + 1]
+                store.segments[key] = (
+                    m.shape_lon[a : b + 1],
+                    m.shape_lat[a : b + 1],
+                    rtime - rtime[0],
+                )
+        return store
+
+    def missing(self, stop_ids):
+        pairs = zip(stop_ids, stop_ids[1:])
+        return [p for p in pairs if p not in self.segments]
+
+    def stitch(self, stop_ids):
+        """(lon, lat, times) along the chained segments of a stop sequence."""
+        lons, lats, times = [], [], []
+        offset = 0.0
+        for i, key in enumerate(zip(stop_ids, stop_ids[1:])):
+            lon, lat, t = self.segments[key]
+            # Consecutive segments meet at the shared stop; keep one vertex of it
+            skip = 1 if i else 0
+            lons.append(lon[skip:])
+            lats.append(lat[skip:])
+            times.append(t[skip:] + offset)
+            offset += t[-1]
+        return np.concatenate(lons), np.concatenate(lats), np.concatenate(times)
+
+
+def to_geojson(shape_id, lon, lat, times):
+    """A FeatureCollection laid out like a brouter-web GeoJSON export."""
+    length = cumulative_distance(lon, lat)[-1]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {
+                    "creator": "shape_stitcher",
+                    "name": shape_id,
+                    "track-length": str(round(length)),
+                    "total-time": str(round(float(times[-1]), 2)),
+                    "times": [round(float(t), 3) for t in times],
+                },
+                "geometry": {
+                    "type": "LineString",
+                    "coordinates": [[x, y] for x, y in zip(lon.tolist(), lat.tolist())],
+                },
+            }
+        ],
+    }
+
+
+def stitch_missing_shapes(trips, stops, routes, dry_run=False):
+    """Write shapes/<shape_id>.geojson for trips whose shape doesn't exist yet.
+
+    Returns (written shape_ids, {shape_id: (stop sequence, missing pairs)}).
+    """
+    have = {t["shape_id"] for t in trips if shape_exists(t.get("shape_id"))}
+    wanted = {}
+    for trip in trips:
+        shape_id = trip.get("shape_id")
+        if shape_id and shape_id not in have:
+            wanted.setdefault(shape_id, stop_sequence(trip))
+    if not wanted:
+        return [], {}
+
+    model = FeedModel.from_trips(
+        [t for t in trips if t.get("shape_id") in have], stops, routes
+    )
+    model.load_shapes(shapes_dir)
+    store = SegmentStore.from_engine(PositionEngine(model, shapes_dir))
+
+    written, unresolved = [], {}
+    for shape_id, seq in sorted(wanted.items()):
+        missing = store.missing(seq)
+        if missing:
+            unresolved[shape_id] = (seq, missing)
+            continue
+        if not dry_run:
+            with open(shape_path(shape_id), "w", encoding="utf-8") as f:
+                json.dump(to_geojson(shape_id, *store.stitch(seq)), f, indent=2)
+        written.append(shape_id)
+    return written, unresolved
+
+
+def shape_path(shape_id):
+    return os.path.join(shapes_dir, f"{shape_id}.geojson")
+
+
+def shape_exists(shape_id):
+    return bool(shape_id) and os.path.exists(shape_path(shape_id))
+
+
+def print_unresolved(unresolved, stops, file=sys.stderr):
+    names = {s["stop_id"]: s["stop_name"] for s in stops}
+    for shape_id, (seq, missing) in unresolved.items():
+        legs = ", ".join(f"{names.get(a, a)} → {names.get(b, b)}" for a, b in missing)
+        print(f"{shape_id}: no geometry for {legs}; route it by hand:", file=file)
+        print(f"  {brouter_url(seq)}", file=file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dry-run", action="store_true", help="don't write files")
+    args = parser.parse_args()
+
+    from gen_gtfs import ROUTES, STOPS, TRIPS
+
+    written, unresolved = stitch_missing_shapes(TRIPS, STOPS, ROUTES, args.dry_run)
+    for shape_id in written:
+        print(f"{shape_id}: stitched from existing segments")
+    print_unresolved(unresolved, STOPS)
+    sys.exit(1 if unresolved else 0)
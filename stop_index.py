@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+stop_index.py
+
+Resolve stop titles as the website writes them ("Leaves Portland, Maine",
+"Boston Logan Int'l Airport") to stop_ids in STOPS.
+
+Names are normalised (case, accents, punctuation, "&", state names, common
+abbreviations and the schedule's "Leaves"/"Arrives" prefixes) and indexed,
+whole and by each "/"-separated alternative ("Waterville, ME", "Colby
+College"), twice: for exact hits, and by the character trigrams of each
+word, so word order doesn't matter. A lookup is a dict hit, or one pass over
+the postings of the title's trigrams (a handful of stops each) rather than a
+scan of every stop. The best candidate is scored by the Dice coefficient of
+the two trigram sets. It is accepted when it scores at least MIN_SCORE and
+beats the runner-up by MARGIN.
+
+Lookups are cached per title. Titles that didn't resolve, or only resolved
+fuzzily, are kept for report().
+
+  usage: stop_index.py TITLE ...   (prints the match and score of each)
+"""
+
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+
+MIN_SCORE = 0.7
+MARGIN = 0.1
+
+PREFIXES = ("leaves", "arrives", "departs", "arrive", "depart")
+# Whole-word replacements, applied after punctuation is stripped
+WORDS = {
+    "maine": "me",
+    "new hampshire": "nh",
+    "intl": "international",
+    "int l": "international",
+    "univ": "university",
+    "ctr": "center",
+    "centre": "center",
+    "sta": "station",
+    "stn": "station",
+    "mt": "mount",
+}
+_WORDS = re.compile(r"\b(" + "|".join(sorted(WORDS, key=len, reverse=True)) + r")\b")
+
+
+def normalise(name: str) -> str:
+    """Lower-case words with accents, punctuation and prefixes removed."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).casefold()
+    name = re.sub(r"[^\w\s]", " ", name.replace("&", " and "))
+    name = _WORDS.sub(lambda m: WORDS[m.group(1)], " ".join(name.split()))
+    words = name.split()
+    while words and words[0] in PREFIXES:
+        words.pop(0)
+    return " ".join(words)
+
+
+def trigrams(normalised: str) -> set[str]:
+    """Trigrams of each word, padded so word starts and ends count."""
+    return {
+        padded[i : i + 3]
+        for word in normalised.split()
+        for padded in [f" {word} "]
+        for i in range(len(padded) - 2)
+    }
+
+
+class StopIndex:
+    def __init__(self, stops):
+        self.names = {s["stop_id"]: s["stop_name"] for s in stops}
+        keys = defaultdict(set)  # normalised name or alternative → stop_ids
+        for s in stops:
+            name = s["stop_name"]
+            for key in {name, *name.split("/")}:
+                keys[normalise(key)].add(s["stop_id"])
+        # An alternative shared by several stops ("Boston") identifies none
+        self.keys = [(k, ids.pop()) for k, ids in keys.items() if len(ids) == 1]
+        self.exact = dict(self.keys)
+        self.postings = defaultdict(list)
+        self.sizes = []
+        for i, (key, _) in enumerate(self.keys):
+            grams = trigrams(key)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(i)
+        self.cache = {}
+        self.unresolved = Counter()
+        self.fuzzy = {}
+
+    def _match(self, title):
+        key = normalise(title)
+        if key in self.exact:
+            return self.exact[key], 1.0, None
+        grams = trigrams(key)
+        shared = Counter(i for gram in grams for i in self.postings.get(gram, ()))
+        best = {}  # stop_id → its best-scoring key
+        for i, n in shared.items():
+            stop_id = self.keys[i][1]
+            score = 2 * n / (len(grams) + self.sizes[i])
+            best[stop_id] = max(best.get(stop_id, 0.0), score)
+        scored = sorted(((score, sid) for sid, score in best.items()), reverse=True)
+        if not scored:
+            return None, 0.0, None
+        score, best = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if score >= MIN_SCORE and score - runner_up >= MARGIN:
+            return best, score, None
+        return None, score, best
+
+    def resolve(self, title):
+        """(stop_id, score) for a title; stop_id is None when no stop is a
+        confident match."""
+        if title not in self.cache:
+            self.cache[title] = self._match(title)
+        stop_id, score, candidate = self.cache[title]
+        if stop_id is None:
+            self.unresolved[title] += 1
+        elif score < 1.0:
+            self.fuzzy[title] = (stop_id, score)
+        return stop_id, score
+
+    def report(self):
+        """Lines describing every unresolved and fuzzily matched title."""
+        lines = []
+        for title, n in sorted(self.unresolved.items()):
+            _, score, candidate = self.cache[title]
+            best = f", best {self.names[candidate]!r} {score:.2f}" if candidate else ""
+            lines.append(f"unresolved stop title {title!r} ({n} rows{best})")
+        for title, (stop_id, score) in sorted(self.fuzzy.items()):
+            lines.append(
+                f"fuzzy stop title {title!r} → {self.names[stop_id]!r} ({score:.2f})"
+            )
+        return lines
+
+    def print_report(self, file=sys.stderr):
+        for line in self.report():
+            print(line, file=file)
+
+
+if __name__ == "__main__":
+    from gen_gtfs import STOPS
+
+    index = StopIndex(STOPS)
+    for title in sys.argv[1:]:
+        stop_id, score = index.resolve(title)
+        name = index.names[stop_id] if stop_id else None
+        print(f"{title!r} → {name!r} ({score:.2f})")
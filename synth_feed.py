@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+synth_feed.py
+
+Scale the real feed up to a target size for benchmarking and profiling the
+build, the validators and the query engines at regional-feed sizes.
+
+The network (routes, stops and shapes) is copied until there are about
+--shapes shapes, each copy shifted by a whole-network offset on a grid and
+each stop jittered by a few metres, so copies don't coincide but stops stay
+on their shapes. Within each copy, every trip is repeated until there are
+about --stop-times stop_times, each repetition shifted by a random start
+offset and with its running times stretched by up to ±STRETCH. Services,
+calendar and calendar_dates are shared by all copies.
+
+Shapes are streamed to OUT/shapes/ as they are generated, in the same
+GeoJSON layout as shapes/ (BRouter properties included), and the feed is
+written to OUT/concord_coach_gtfs.zip by the regular build path.
+
+  usage: synth_feed.py OUT [--stop-times N] [--shapes N] [--seed N] [--no-zip]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from gen_gtfs import ROUTES, STOPS, TRIPS, build_tables, script_dir, write_feed
+
+GRID_DEG = 0.05  # ~5 km between network copies
+JITTER_DEG = 0.0001  # ~10 m per stop
+MAX_SHIFT_MIN = 12 * 60  # start offsets of repeated trips
+STRETCH = 0.05
+
+
+def _shape_ids(trips):
+    return sorted({t["shape_id"] for t in trips if "shape_id" in t})
+
+
+def _offset(copy, copies):
+    """Whole-network (dlon, dlat) of a copy, laid out on a square grid."""
+    side = math.isqrt(copies - 1) + 1
+    return (copy % side) * GRID_DEG, (copy // side) * GRID_DEG
+
+
+def plan(stop_times, shapes, trips=TRIPS):
+    """(network copies, trip repetitions per copy) for the target sizes."""
+    n_shapes = len(_shape_ids(trips))
+    n_st = sum(len(t["stop_times"]) for t in trips)
+    copies = max(1, math.ceil(shapes / n_shapes))
+    reps = max(1, math.ceil(stop_times / (n_st * copies)))
+    return copies, reps
+
+
+def synthesize(stop_times, shapes, seed=0, shapes_dir=None):
+    """Return (routes, trips, stops); shapes are written to shapes_dir."""
+    rng = np.random.default_rng(seed)
+    copies, reps = plan(stop_times, shapes)
+    features = {}
+    for shape_id in _shape_ids(TRIPS):
+        with open(f"{script_dir}/shapes/{shape_id}.geojson", encoding="utf-8") as f:
+            features[shape_id] = json.load(f)
+
+    routes, trips, stops = [], [], []
+    for copy in range(copies):
+        dlon, dlat = _offset(copy, copies)
+        suffix = f"_S{copy}" if copy else ""
+        routes += [{**r, "route_id": r["route_id"] + suffix} for r in ROUTES]
+        jitter = rng.uniform(-JITTER_DEG, JITTER_DEG, (len(STOPS), 2))
+        stops += [
+            {
+                **s,
+                "stop_id": s["stop_id"] + suffix,
+                "stop_lat": s["stop_lat"] + dlat + jy,
+                "stop_lon": s["stop_lon"] + dlon + jx,
+            }
+            for s, (jx, jy) in zip(STOPS, jitter)
+        ]
+        if shapes_dir:
+            for shape_id, fc in features.items():
+                _write_shape(fc, f"{shapes_dir}/{shape_id}{suffix}.geojson", dlon, dlat)
+
+        for rep in range(reps):
+            shift = rng.integers(0, MAX_SHIFT_MIN, len(TRIPS)) * 60 if rep else None
+            stretch = rng.uniform(1 - STRETCH, 1 + STRETCH, len(TRIPS))
+            for i, trip in enumerate(TRIPS):
+                times = [t for t, _ in trip["stop_times"]]
+                start = times[0] + (int(shift[i]) if rep else 0)
+                trip_suffix = f"{suffix}_R{rep}" if rep else suffix
+                copied = {
+                    **trip,
+                    "route_id": trip["route_id"] + suffix,
+                    "trip_id": trip["trip_id"] + trip_suffix,
+                    "stop_times": [
+                        (
+                            start + round((t - times[0]) * stretch[i] / 60) * 60,
+                            sid + suffix,
+                        )
+                        for t, (_, sid) in zip(times, trip["stop_times"])
+                    ],
+                }
+                if "shape_id" in trip:
+                    copied["shape_id"] = trip["shape_id"] + suffix
+                trips.append(copied)
+    return routes, trips, stops
+
+
+def _write_shape(fc, path, dlon, dlat):
+    feature = fc["features"][0]
+    coords = [
+        [round(c[0] + dlon, 6), round(c[1] + dlat, 6), *c[2:]]
+        for c in feature["geometry"]["coordinates"]
+    ]
+    out = {
+        **fc,
+        "features": [
+            {**feature, "geometry": {**feature["geometry"], "coordinates": coords}}
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(out))  # dumps encodes in C; dump streams in Python
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("out", help="output directory")
+    parser.add_argument("--stop-times", type=int, default=1_000_000)
+    parser.add_argument("--shapes", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-zip", action="store_true", help="only write the shapes/ directory"
+    )
+    args = parser.parse_args()
+
+    shapes_dir = os.path.join(args.out, "shapes")
+    os.makedirs(shapes_dir, exist_ok=True)
+    routes, trips, stops = synthesize(
+        args.stop_times, args.shapes, args.seed, shapes_dir
+    )
+    n_st = sum(len(t["stop_times"]) for t in trips)
+    n_shapes = len(_shape_ids(trips))
+    print(
+        f"{len(routes)} routes, {len(stops)} stops, {len(trips)} trips, "
+        f"{n_st} stop_times, {n_shapes} shapes",
+        file=sys.stderr,
+    )
+    if not args.no_zip:
+        tables = build_tables(
+            trips=trips, stops=stops, routes=routes, shapes_dir=shapes_dir
+        )
+        write_feed(tables, os.path.join(args.out, "concord_coach_gtfs"))
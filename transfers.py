@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+transfers.py
+
+Build transfers.txt from the connections the timetable actually offers
+between routes, at the same stop or a short walk apart.
+
+  - Stop pairs within WALK_RADIUS_M are found through a grid of cells at
+    least WALK_RADIUS_M wide, each stop compared only with the stops in its
+    own and the 8 surrounding cells. Walking time is the straight-line
+    distance × DETOUR at WALK_SPEED_MPS.
+  - Every stop is also paired with itself. The minimum transfer time of a
+    pair is MIN_TRANSFER_S plus the walk, rounded up to whole minutes.
+  - For each pair, arrivals at one stop and departures from the other
+    (sorted by time, per route and service) are merged in one pass. A
+    connection is a departure on another route between the minimum transfer
+    time and MAX_WAIT_S after an arrival, where the two trips' services run
+    on at least one common day.
+
+One transfer_type=2 row is written per (from stop, to stop, from route, to
+route) with at least one connection. The stage is O(n log n) in stop_times
+for the sort plus, per stop pair, O(arrivals × G + departures) for the
+merge, where G is the number of (route, service) groups departing the stop:
+a handful here, but a stop served by many routes and services pays for each.
+
+  usage: transfers.py   (lists the connections found and the shortest wait)
+"""
+
+import math
+from collections import defaultdict
+
+from blocks import service_days
+from position_engine import EARTH_RADIUS_M
+
+WALK_RADIUS_M = 500
+WALK_SPEED_MPS = 1.2
+DETOUR = 1.3  # street distance over straight-line distance
+MIN_TRANSFER_S = 5 * 60
+MAX_WAIT_S = 2 * 3600
+MIN_TRANSFER_TIME = 2  # transfer_type: needs min_transfer_time seconds
+
+M_PER_DEG = math.pi / 180 * EARTH_RADIUS_M
+
+
+def _distance(a, b):
+    """Haversine metres between two stops."""
+    lat0, lat1 = math.radians(a["stop_lat"]), math.radians(b["stop_lat"])
+    dlat = lat1 - lat0
+    dlon = math.radians(b["stop_lon"] - a["stop_lon"])
+    h = (
+        math.sin(dlat / 2) ** 2
+        + math.cos(lat0) * math.cos(lat1) * math.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def walking_pairs(stops, radius=WALK_RADIUS_M):
+    """{(from_stop_id, to_stop_id): walking seconds} for every stop and
+    itself (0 s) and every ordered pair within radius."""
+    if not stops:
+        return {}
+    cell_lat = radius / M_PER_DEG
+    # Longitude cells sized for the stop furthest from the equator, where a
+    # degree is shortest, are at least radius wide everywhere
+    widest = max(abs(s["stop_lat"]) for s in stops)
+    cell_lon = radius / (M_PER_DEG * math.cos(math.radians(widest)))
+    grid = defaultdict(list)
+    for s in stops:
+        grid[s["stop_lat"] // cell_lat, s["stop_lon"] // cell_lon].append(s)
+
+    pairs = {}
+    for (cy, cx), cell in grid.items():
+        near = [
+            b
+            for dy in (-1, 0, 1)
+            for dx in (-1, 0, 1)
+            for b in grid.get((cy + dy, cx + dx), ())
+        ]
+        for a in cell:
+            for b in near:
+                if a is b:
+                    pairs[a["stop_id"], b["stop_id"]] = 0
+                elif (d := _distance(a, b)) <= radius:
+                    pairs[a["stop_id"], b["stop_id"]] = math.ceil(
+                        d * DETOUR / WALK_SPEED_MPS
+                    )
+    return pairs
+
+
+def _events(trips):
+    """({stop_id: arrivals}, {stop_id: {(route_id, service_id): departures}}):
+    arrivals are time-sorted (time, route_id, service_id), departures sorted
+    times."""
+    arrivals = defaultdict(list)
+    departures = defaultdict(lambda: defaultdict(list))
+    for trip in trips:
+        stop_times = trip["stop_times"]
+        key = (trip["route_id"], trip["service_id"])
+        for t, stop_id in stop_times[1:]:
+            arrivals[stop_id].append((t, *key))
+        for t, stop_id in stop_times[:-1]:
+            departures[stop_id][key].append(t)
+    for events in arrivals.values():
+        events.sort()
+    for groups in departures.values():
+        for times in groups.values():
+            times.sort()
+    return arrivals, departures
+
+
+def connections(arrivals, departures, min_time, together, max_wait=MAX_WAIT_S):
+    """{(from_route_id, to_route_id): shortest wait} over the connections
+    between time-sorted arrivals and departures grouped by (route, service).
+    together holds the (service, service) pairs that run on a common day.
+
+    Each group keeps a pointer to its first departure an arrival could still
+    catch; arrivals only move forward in time, so the pointers do too. Every
+    departure is stepped over once, but every arrival visits every group:
+    O(arrivals × groups + departures)."""
+    found = {}
+    pointers = dict.fromkeys(departures, 0)
+    for t, route, service in arrivals:
+        for (to_route, to_service), times in departures.items():
+            if to_route == route or (service, to_service) not in together:
+                continue
+            i = pointers[to_route, to_service]
+            while i < len(times) and times[i] < t + min_time:
+                i += 1
+            pointers[to_route, to_service] = i
+            if i < len(times) and times[i] <= t + max_wait:
+                key = (route, to_route)
+                found[key] = min(found.get(key, max_wait), times[i] - t)
+    return found
+
+
+def _together(calendar, calendar_dates):
+    """(service_id, service_id) pairs active on at least one common day."""
+    pairs = set()
+    for services in service_days(calendar, calendar_dates):
+        pairs.update((a, b) for a in services for b in services)
+    return pairs
+
+
+def build_transfers(trips, stops, calendar, calendar_dates, radius=WALK_RADIUS_M):
+    """(transfers.txt rows, the shortest wait each row stands for)."""
+    arrivals, departures = _events(trips)
+    together = _together(calendar, calendar_dates)
+    rows, waits = [], []
+    for (a, b), walk in sorted(walking_pairs(stops, radius).items()):
+        if a not in arrivals or b not in departures:
+            continue
+        min_time = math.ceil((MIN_TRANSFER_S + walk) / 60) * 60
+        found = connections(arrivals[a], departures[b], min_time, together)
+        for (from_route, to_route), wait in sorted(found.items()):
+            rows.append(
+                {
+                    "from_stop_id": a,
+                    "to_stop_id": b,
+                    "from_route_id": from_route,
+                    "to_route_id": to_route,
+                    "transfer_type": MIN_TRANSFER_TIME,
+                    "min_transfer_time": min_time,
+                }
+            )
+            waits.append(wait)
+    return rows, waits
+
+
+if __name__ == "__main__":
+    from gen_gtfs import CALENDAR, CALENDAR_DATES, STOPS, TRIPS
+    from gtfs_time import format_time
+
+    names = {s["stop_id"]: s["stop_name"] for s in STOPS}
+    rows, waits = build_transfers(TRIPS, STOPS, CALENDAR, CALENDAR_DATES)
+    for row, wait in zip(rows, waits):
+        at = names[row["from_stop_id"]]
+        if row["to_stop_id"] != row["from_stop_id"]:
+            at += f" → {names[row['to_stop_id']]}"
+        print(
+            f"{at}: {row['from_route_id']} → {row['to_route_id']}, "
+            f"min {row['min_transfer_time'] // 60} min, "
+            f"shortest wait {format_time(wait, seconds=False)}"
+        )
+    print(f"{len(rows)} transfers")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+validate_gtfs.py
+
+Structural validation of the feed in a single streaming pass. Tables are
+consumed in dependency order (agency, stops, routes, calendar, calendar_dates,
+shapes, trips, stop_times, frequencies) and each row is checked against
+hash-set indexes of the tables before it:
+
+  - ID uniqueness         (stop_id, route_id, service_id, trip_id, ...)
+  - referential integrity (trip → route/service/shape, stop_time → trip/stop)
+  - time monotonicity     (stop_sequence and times never go backwards)
+  - calendar coverage     (every service_id used by a trip runs on some date)
+
+Problems are reported as "file:line: message", with line numbers counted the
+way they appear in the written CSV (header is line 1).
+
+  usage: validate_gtfs.py [feed.zip]   (default: the tables in gen_gtfs.py)
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+from feed_model import WEEKDAYS
+from gtfs_time import format_time, parse_time
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+
+ERROR = "ERROR"
+WARNING = "WARNING"
+
+
+def _date(yyyymmdd) -> date:
+    v = int(yyyymmdd)
+    return date(v // 10000, v // 100 % 100, v % 100)
+
+
+def _time(value):
+    """Seconds for a CSV time or an in-memory int one; None when blank."""
+    return None if value in ("", None) else parse_time(value)
+
+
+def _runs_any_day(row, removed) -> bool:
+    """True if a calendar.txt row is active on at least one non-removed date."""
+    days = [i for i, d in enumerate(WEEKDAYS) if int(row.get(d) or 0)]
+    if not days:
+        return False
+    start, end = _date(row["start_date"]), _date(row["end_date"])
+    d = start
+    while d <= end:
+        if d.weekday() in days and int(d.strftime("%Y%m%d")) not in removed:
+            return True
+        d += timedelta(days=1)
+    return False
+
+
+class Validator:
+    def __init__(self):
+        self.problems = []  # (severity, file, line, message)
+
+    def report(self, severity, file, line, message):
+        self.problems.append((severity, file, line, message))
+
+    @property
+    def errors(self):
+        return [p for p in self.problems if p[0] == ERROR]
+
+    def _unique(self, file, rows, key):
+        """Index rows by key, reporting duplicates and blanks."""
+        seen = {}
+        for line, row in enumerate(rows, start=2):
+            value = row.get(key)
+            if value in (None, ""):
+                self.report(ERROR, file, line, f"missing {key}")
+            elif value in seen:
+                self.report(
+                    ERROR, file, line, f"duplicate {key} {value} (line {seen[value]})"
+                )
+            else:
+                seen[value] = line
+        return seen
+
+    def validate(self, tables, shape_ids=None):
+        """Validate tables ({filename: iterable of row dicts}) in one pass.
+
+        shape_ids is the set of shape geometries available; when None the
+        shape_id column of shapes.txt is used.
+        """
+        agencies = self._unique("agency.txt", tables.get("agency.txt", ()), "agency_id")
+
+        stops = self._unique("stops.txt", tables.get("stops.txt", ()), "stop_id")
+
+        routes = {}
+        for line, row in enumerate(tables.get("routes.txt", ()), start=2):
+            route_id = row.get("route_id")
+            if route_id in routes:
+                self.report(
+                    ERROR,
+                    "routes.txt",
+                    line,
+                    f"duplicate route_id {route_id} (line {routes[route_id]})",
+                )
+                continue
+            routes[route_id] = line
+            agency_id = row.get("agency_id")
+            if agencies and agency_id not in agencies:
+                self.report(ERROR, "routes.txt", line, f"unknown agency_id {agency_id}")
+
+        calendar = list(tables.get("calendar.txt", ()))
+        services = self._unique("calendar.txt", calendar, "service_id")
+        for line, row in enumerate(calendar, start=2):
+            if _date(row["start_date"]) > _date(row["end_date"]):
+                self.report(ERROR, "calendar.txt", line, "start_date after end_date")
+
+        removed, added, seen_dates = {}, {}, set()
+        added_line = {}  # service_id -> first calendar_dates.txt line adding it
+        for line, row in enumerate(tables.get("calendar_dates.txt", ()), start=2):
+            sid, day = row["service_id"], int(row["date"])
+            if (sid, day) in seen_dates:
+                self.report(
+                    ERROR,
+                    "calendar_dates.txt",
+                    line,
+                    f"duplicate service_id/date {sid} {day}",
+                )
+            seen_dates.add((sid, day))
+            target = added if int(row["exception_type"]) == 1 else removed
+            target.setdefault(sid, set()).add(day)
+            if target is added:
+                added_line.setdefault(sid, line)
+        del seen_dates
+
+        if shape_ids is None:
+            shape_ids = {row["shape_id"] for row in tables.get("shapes.txt", ())}
+
+        trips = {}  # trip_id -> line
+        used_services = set()
+        for line, row in enumerate(tables.get("trips.txt", ()), start=2):
+            trip_id = row.get("trip_id")
+            if trip_id in trips:
+                self.report(
+                    ERROR,
+                    "trips.txt",
+                    line,
+                    f"duplicate trip_id {trip_id} (line {trips[trip_id]})",
+                )
+                continue
+            trips[trip_id] = line
+            if row.get("route_id") not in routes:
+                self.report(
+                    ERROR, "trips.txt", line, f"unknown route_id {row.get('route_id')}"
+                )
+            sid = row.get("service_id")
+            used_services.add(sid)
+            if sid not in services and sid not in added:
+                self.report(
+                    ERROR,
+                    "trips.txt",
+                    line,
+                    f"service_id {sid} not in calendar.txt or calendar_dates.txt",
+                )
+            shape_id = row.get("shape_id")
+            if shape_id and shape_id not in shape_ids:
+                self.report(
+                    ERROR, "trips.txt", line, f"shape_id {shape_id} has no geometry"
+                )
+
+        # trip_id -> (stop_sequence, departure, line) of the last row seen
+        last = {}
+        for line, row in enumerate(tables.get("stop_times.txt", ()), start=2):
+            trip_id = row["trip_id"]
+            if trip_id not in trips:
+                self.report(ERROR, "stop_times.txt", line, f"unknown trip_id {trip_id}")
+            if row["stop_id"] not in stops:
+                self.report(
+                    ERROR, "stop_times.txt", line, f"unknown stop_id {row['stop_id']}"
+                )
+            seq = int(row["stop_sequence"])
+            arr, dep = _time(row.get("arrival_time")), _time(row.get("departure_time"))
+            dep = arr if dep is None else dep
+            if arr is not None and dep is not None and dep < arr:
+                self.report(
+                    ERROR, "stop_times.txt", line, "departure_time before arrival_time"
+                )
+            prev = last.get(trip_id)
+            if prev is not None:
+                prev_seq, prev_dep, prev_line = prev
+                if seq <= prev_seq:
+                    self.report(
+                        ERROR,
+                        "stop_times.txt",
+                        line,
+                        f"{trip_id} stop_sequence {seq} not after {prev_seq} "
+                        f"(line {prev_line})",
+                    )
+                elif arr is not None and prev_dep is not None and arr < prev_dep:
+                    self.report(
+                        ERROR,
+                        "stop_times.txt",
+                        line,
+                        f"{trip_id} goes back in time: {format_time(arr)} "
+                        f"after departing line {prev_line}",
+                    )
+            if dep is None and prev is not None:
+                dep = prev[1]
+            last[trip_id] = (seq, dep, line)
+
+        for line, row in enumerate(tables.get("frequencies.txt", ()), start=2):
+            if row["trip_id"] not in trips:
+                self.report(
+                    ERROR, "frequencies.txt", line, f"unknown trip_id {row['trip_id']}"
+                )
+            if int(row["headway_secs"]) <= 0:
+                self.report(ERROR, "frequencies.txt", line, "headway_secs must be > 0")
+            if parse_time(row["end_time"]) <= parse_time(row["start_time"]):
+                self.report(
+                    ERROR, "frequencies.txt", line, "end_time not after start_time"
+                )
+
+        for trip_id, line in trips.items():
+            if trip_id not in last:
+                self.report(ERROR, "trips.txt", line, f"{trip_id} has no stop_times")
+
+        for sid in sorted(used_services & services.keys()):
+            row = calendar[services[sid] - 2]
+            if not _runs_any_day(row, removed.get(sid, ())) and sid not in added:
+                self.report(
+                    ERROR,
+                    "calendar.txt",
+                    services[sid],
+                    f"service_id {sid} is never active",
+                )
+        for sid in sorted((services.keys() | added.keys()) - used_services):
+            if sid in services:
+                where = ("calendar.txt", services[sid])
+            else:
+                where = ("calendar_dates.txt", added_line[sid])
+            self.report(WARNING, *where, f"service_id {sid} has no trips")
+
+        return self.problems
+
+
+def validate(tables, shape_ids=None):
+    return Validator().validate(tables, shape_ids)
+
+
+def print_problems(problems, file=sys.stderr):
+    for severity, fname, line, message in problems:
+        print(f"{severity} {fname}:{line}: {message}", file=file)
+
+
+def source_shape_ids(shapes_dir=None) -> set[str]:
+    shapes_dir = shapes_dir or os.path.join(script_dir, "shapes")
+    return {
+        f[: -len(".geojson")] for f in os.listdir(shapes_dir) if f.endswith(".geojson")
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from gtfs_reader import GTFSReader
+
+        with GTFSReader(sys.argv[1]) as reader:
+            problems = validate({name: reader.rows(name) for name in reader.members})
+    else:
+        import gen_gtfs
+
+        problems = validate(gen_gtfs.build_tables(shapes=False), source_shape_ids())
+
+    print_problems(problems)
+    errors = sum(p[0] == ERROR for p in problems)
+    print(f"{errors} errors, {len(problems) - errors} warnings", file=sys.stderr)
+    sys.exit(1 if errors else 0)
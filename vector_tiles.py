@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+vector_tiles.py
+
+Cut shapes/*.geojson and STOPS into a pyramid of Mapbox Vector Tiles, written
+as static files a web map can load directly:
+
+  OUT/{z}/{x}/{y}.pbf   one tile per non-empty z/x/y (uncompressed MVT 2.1)
+  OUT/metadata.json     TileJSON with the layers, zoom range and bounds
+
+Two layers: "routes", one line per shape (shape_id, route_id,
+route_long_name), and "stops", one point per stop (stop_id, stop_name) from
+STOPS_MIN_ZOOM up. At each zoom, lines are simplified (Douglas–Peucker) to
+TOLERANCE_PX screen pixels, so low zooms carry a few hundred points for the
+whole network instead of every routed vertex, then clipped to each tile plus
+a BUFFER so strokes join up across tile edges.
+
+Zoom levels are independent and are cut in parallel, one process each,
+highest (largest) first.
+
+  usage: vector_tiles.py [OUT] [--min-zoom N] [--max-zoom N] [--jobs N]
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+EXTENT = 4096
+BUFFER = 64  # tile units kept past each edge
+TILE_PX = 256
+TOLERANCE_PX = 1.0
+MIN_ZOOM = 4
+MAX_ZOOM = 14
+STOPS_MIN_ZOOM = 8
+
+_MOVE_TO = 1
+_LINE_TO = 2
+_POINT = 1
+_LINESTRING = 2
+
+
+# ── GEOMETRY ──
+def project(lon, lat):
+    """Web Mercator world coordinates: x, y in [0, 1), y pointing south."""
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0
+    s = np.sin(np.radians(np.asarray(lat, dtype=float)))
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return x, y
+
+
+def unproject(x, y):
+    """(lon, lat) of a world coordinate."""
+    return x * 360.0 - 180.0, math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+
+def simplify(x, y, tolerance):
+    """Douglas–Peucker: mask of the points to keep so that no dropped point
+    is more than tolerance from the simplified line."""
+    keep = np.zeros(len(x), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(x) - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[a + 1 : b] - x[a], y[a + 1 : b] - y[a]
+        norm = math.hypot(dx, dy)
+        dist = np.abs(px * dy - py * dx) / norm if norm else np.hypot(px, py)
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            i += a + 1
+            keep[i] = True
+            stack += [(a, i), (i, b)]
+    return keep
+
+
+def _clip_segment(x0, y0, x1, y1, lo, hi):
+    """Liang–Barsky: the part of a segment inside the square [lo, hi]², or
+    None."""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0 - lo), (dx, hi - x0), (-dy, y0 - lo), (dy, hi - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        r = q / p
+        if p < 0:
+            if r > t1:
+                return None
+            t0 = max(t0, r)
+        else:
+            if r < t0:
+                return None
+            t1 = min(t1, r)
+    return x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy
+
+
+def clip_line(X, Y):
+    """{(x, y) tile: [part, …]} for a line in tile coordinates of one zoom
+    (X, Y = world × 2^z); each part is a list of integer (x, y) points in
+    tile units."""
+    pad = BUFFER / EXTENT
+    segments = defaultdict(list)
+    for i in range(len(X) - 1):
+        x0, x1 = sorted((X[i], X[i + 1]))
+        y0, y1 = sorted((Y[i], Y[i + 1]))
+        for col in range(math.floor(x0 - pad), math.floor(x1 + pad) + 1):
+            for row in range(math.floor(y0 - pad), math.floor(y1 + pad) + 1):
+                segments[col, row].append(i)
+
+    tiles = {}
+    for (col, row), indexes in segments.items():
+        parts, last = [], None
+        for i in indexes:
+            seg = _clip_segment(
+                (X[i] - col) * EXTENT,
+                (Y[i] - row) * EXTENT,
+                (X[i + 1] - col) * EXTENT,
+                (Y[i + 1] - row) * EXTENT,
+                -BUFFER,
+                EXTENT + BUFFER,
+            )
+            if seg is None:
+                continue
+            start = (round(seg[0]), round(seg[1]))
+            end = (round(seg[2]), round(seg[3]))
+            # Consecutive segments that meet inside the tile continue one part
+            if last == i - 1 and parts[-1][-1] == start:
+                if end != start:
+                    parts[-1].append(end)
+            else:
+                parts.append([start] if end == start else [start, end])
+            last = i
+        parts = [p for p in parts if len(p) > 1]
+        if parts:
+            tiles[col, row] = parts
+    return tiles
+
+
+# ── MVT ENCODING ──
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _message(field: int, payload: bytes) -> bytes:
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values) -> bytes:
+    return _message(field, b"".join(map(_varint, values)))
+
+
+def _zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _geometry(parts):
+    """Command integers for parts (lines) or single-point parts (points)."""
+    out, cx, cy = [], 0, 0
+    for part in parts:
+        for j, (x, y) in enumerate(part):
+            if j == 0:
+                out.append(_MOVE_TO | 1 << 3)
+            elif j == 1:
+                out.append(_LINE_TO | (len(part) - 1) << 3)
+            out += (_zigzag(x - cx), _zigzag(y - cy))
+            cx, cy = x, y
+    return out
+
+
+def encode_layer(name, features):
+    """One MVT layer from (properties, geom type, parts) features."""
+    keys, values = {}, {}
+    body = []
+    for props, geom_type, parts in features:
+        tags = []
+        for k, v in props.items():
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault(str(v), len(values)))
+        feature = (
+            _packed(2, tags)
+            + _varint(3 << 3)
+            + _varint(geom_type)
+            + _packed(4, _geometry(parts))
+        )
+        body.append(_message(2, feature))
+    return (
+        _varint(15 << 3)
+        + _varint(2)  # version
+        + _message(1, name.encode("utf-8"))
+        + b"".join(body)
+        + b"".join(_message(3, k.encode("utf-8")) for k in keys)
+        + b"".join(_message(4, _message(1, v.encode("utf-8"))) for v in values)
+        + _varint(5 << 3)
+        + _varint(EXTENT)
+    )
+
+
+# ── PYRAMID ──
+def load_lines(trips=None, routes=None, shapes_dir=None):
+    """[(properties, x, y)] in world coordinates, one per shape used by trips."""
+    from gen_gtfs import ROUTES, TRIPS, iter_shape_points, script_dir
+
+    trips = TRIPS if trips is None else trips
+    names = {r["route_id"]: r["route_long_name"] for r in routes or ROUTES}
+    shape_routes = {}
+    for t in trips:
+        if "shape_id" in t:
+            shape_routes.setdefault(t["shape_id"], t["route_id"])
+    lines = []
+    for shape_id, route_id in sorted(shape_routes.items()):
+        points = list(
+            iter_shape_points([shape_id], shapes_dir or f"{script_dir}/shapes")
+        )
+        lon = np.fromiter((p.shape_pt_lon for p in points), float, len(points))
+        lat = np.fromiter((p.shape_pt_lat for p in points), float, len(points))
+        props = {
+            "shape_id": shape_id,
+            "route_id": route_id,
+            "route_long_name": names.get(route_id, ""),
+        }
+        lines.append((props, *project(lon, lat)))
+    return lines
+
+
+def load_stops(stops=None):
+    """[(properties, x, y)] in world coordinates."""
+    from gen_gtfs import STOPS
+
+    stops = STOPS if stops is None else stops
+    x, y = project([s["stop_lon"] for s in stops], [s["stop_lat"] for s in stops])
+    return [
+        ({"stop_id": s["stop_id"], "stop_name": s["stop_name"]}, sx, sy)
+        for s, sx, sy in zip(stops, x, y)
+    ]
+
+
+def build_zoom(z, lines, stops, out_dir):
+    """Write every non-empty tile of zoom z; returns (z, tiles, bytes)."""
+    n = 1 << z
+    tolerance = TOLERANCE_PX / (TILE_PX * n)
+    layers = defaultdict(lambda: {"routes": [], "stops": []})
+    for props, x, y in lines:
+        keep = simplify(x, y, tolerance)
+        for tile, parts in clip_line(x[keep] * n, y[keep] * n).items():
+            layers[tile]["routes"].append((props, _LINESTRING, parts))
+    if z >= STOPS_MIN_ZOOM:
+        pad = BUFFER / EXTENT
+        for props, x, y in stops:
+            X, Y = x * n, y * n
+            for col in range(math.floor(X - pad), math.floor(X + pad) + 1):
+                for row in range(math.floor(Y - pad), math.floor(Y + pad) + 1):
+                    point = [(round((X - col) * EXTENT), round((Y - row) * EXTENT))]
+                    layers[col, row]["stops"].append((props, _POINT, [point]))
+
+    size = 0
+    for (col, row), tile in layers.items():
+        data = b"".join(
+            _message(3, encode_layer(name, features))
+            for name, features in tile.items()
+            if features
+        )
+        os.makedirs(f"{out_dir}/{z}/{col}", exist_ok=True)
+        with open(f"{out_dir}/{z}/{col}/{row}.pbf", "wb") as f:
+            f.write(data)
+        size += len(data)
+    return z, len(layers), size
+
+
+def write_tiles(out_dir, lines, stops, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, jobs=None):
+    """Write the pyramid and metadata.json to out_dir (replacing it); returns
+    build_zoom's (z, tiles, bytes) per zoom."""
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    zooms = range(max_zoom, min_zoom - 1, -1)
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(build_zoom, z, lines, stops, out_dir) for z in zooms]
+        report = sorted(f.result() for f in futures)
+
+    xs = np.concatenate([x for _, x, _ in lines] + [[x for _, x, _ in stops]])
+    ys = np.concatenate([y for _, _, y in lines] + [[y for _, _, y in stops]])
+    west, north = unproject(xs.min(), ys.min())
+    east, south = unproject(xs.max(), ys.max())
+    metadata = {
+        "tilejson": "3.0.0",
+        "name": "concord_coach_gtfs",
+        "tiles": ["{z}/{x}/{y}.pbf"],
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "bounds": [round(v, 6) for v in (west, south, east, north)],
+        "center": [round((west + east) / 2, 6), round((south + north) / 2, 6), 8],
+        "vector_layers": [
+            {
+                "id": "routes",
+                "fields": {
+                    "shape_id": "String",
+                    "route_id": "String",
+                    "route_long_name": "String",
+                },
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+            },
+            {
+                "id": "stops",
+                "fields": {"stop_id": "String", "stop_name": "String"},
+                "minzoom": max(min_zoom, STOPS_MIN_ZOOM),
+                "maxzoom": max_zoom,
+            },
+        ],
+    }
+    with open(f"{out_dir}/metadata.json", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+        f.write("\n")
+    return report
+
+
+if __name__ == "__main__":
+    import time
+
+    from gen_gtfs import feed_path
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("out", nargs="?", default=f"{feed_path}_tiles")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = write_tiles(
+        args.out, load_lines(), load_stops(), args.min_zoom, args.max_zoom, args.jobs
+    )
+    for z, tiles, size in report:
+        print(f"  z{z:<3} {tiles:>6,} tiles {size:>12,} bytes")
+    print(
+        f"  {sum(r[1] for r in report):,} tiles in {time.perf_counter() - start:.1f}s"
+    )
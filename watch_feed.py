@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+watch_feed.py
+
+Rebuild concord_coach_gtfs.zip whenever gen_gtfs.py or shapes/ changes, for
+a fast edit → feed loop while working on the feed definitions.
+
+The sources are polled (a stat of gen_gtfs.py and each shapes/*.geojson,
+POLL_S apart) and a burst of changes is collapsed into one rebuild once
+nothing has moved for DEBOUNCE_S. Between rebuilds the watcher keeps:
+
+  - each shape's parsed, CSV-encoded points, keyed by its file's mtime and
+    size, so a new or edited GeoJSON costs one file and shapes.txt is just
+    the cached pieces joined
+  - every member's deflated stream (feed_archive.write_members' cache), so
+    only tables whose CSV actually changed are compressed again
+
+An edit to gen_gtfs.py reloads its definitions (TRIPS, STOPS, CALENDAR, …)
+and re-flattens the small tables, which takes milliseconds. Each rebuild is
+validated like the regular build and the zip is left alone while there are
+errors; shape stitching and the speed / stop proximity reports are skipped,
+run the full build for those (and for --export / --tiles).
+
+  usage: watch_feed.py [--compression PROFILE] [--frequencies]
+                       [--min-layover MINUTES]   (or gen_gtfs.py --watch)
+"""
+
+import importlib
+import os
+import sys
+import time
+import traceback
+
+from blocks import MIN_LAYOVER_S
+from feed_archive import (
+    DEFAULT_PROFILE,
+    PROFILES,
+    member_levels,
+    to_csv,
+    write_members,
+)
+from records import ShapePoint
+from validate_gtfs import ERROR, print_problems, validate
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+GEN_GTFS = os.path.join(script_dir, "gen_gtfs.py")
+SHAPES_DIR = os.path.join(script_dir, "shapes")
+POLL_S = 0.1
+DEBOUNCE_S = 0.15
+
+
+def snapshot(shapes_dir=SHAPES_DIR):
+    """{path: (mtime_ns, size)} of gen_gtfs.py and every shape file."""
+    snap = {}
+    st = os.stat(GEN_GTFS)
+    snap[GEN_GTFS] = (st.st_mtime_ns, st.st_size)
+    with os.scandir(shapes_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".geojson"):
+                st = entry.stat()
+                snap[entry.path] = (st.st_mtime_ns, st.st_size)
+    return snap
+
+
+class FeedWatcher:
+    def __init__(
+        self,
+        profile=DEFAULT_PROFILE,
+        levels=None,
+        frequencies=False,
+        min_layover=MIN_LAYOVER_S,
+    ):
+        self.gen = importlib.import_module("gen_gtfs")
+        self.profile = profile
+        self.levels = levels
+        self.frequencies = frequencies
+        self.min_layover = min_layover
+        self.shape_chunks = {}  # shape_id → ((mtime_ns, size), CSV lines)
+        self.packed = {}  # write_members' cache
+
+    def shapes_csv(self, shape_ids, snap):
+        """shapes.txt as CSV, re-reading only shapes whose file changed."""
+        chunks = []
+        for shape_id in shape_ids:
+            path = os.path.join(SHAPES_DIR, f"{shape_id}.geojson")
+            stamp = snap.get(path)
+            cached = self.shape_chunks.get(shape_id)
+            if cached is None or cached[0] != stamp:
+                rows = self.gen.iter_shape_points([shape_id], SHAPES_DIR)
+                cached = self.shape_chunks[shape_id] = (stamp, to_csv(rows, False))
+            chunks.append(cached[1])
+        if not chunks:
+            return b""
+        header = ",".join(ShapePoint.__slots__).encode() + b"\n"
+        return header + b"".join(chunks)
+
+    def rebuild(self, snap, reload=False):
+        """Write the zip; returns the members that changed, or None when the
+        definitions didn't validate."""
+        if reload:
+            self.gen = importlib.reload(self.gen)
+        gen = self.gen
+        tables = gen.build_tables(
+            shapes=False, frequencies=self.frequencies, min_layover=self.min_layover
+        )
+        sources = {
+            os.path.basename(p)[: -len(".geojson")] for p in snap if p != GEN_GTFS
+        }
+        problems = validate(tables, sources)
+        print_problems(problems)
+        if any(severity == ERROR for severity, *_ in problems):
+            return None
+
+        datas = {name: to_csv(rows) for name, rows in tables.items()}
+        used = sorted({t["shape_id"] for t in gen.TRIPS if "shape_id" in t})
+        datas["shapes.txt"] = self.shapes_csv(used, snap)
+        changed = [n for n, d in datas.items() if self.packed.get(n, ())[1:2] != (d,)]
+        levels = member_levels(datas, self.profile, self.levels)
+        write_members(datas, f"{gen.feed_path}.zip", levels, cache=self.packed)
+        return changed
+
+
+def _settle(snap, debounce):
+    """Wait until a burst of changes stops; returns the final snapshot."""
+    while True:
+        time.sleep(debounce)
+        latest = snapshot()
+        if latest == snap:
+            return snap
+        snap = latest
+
+
+def watch(
+    profile=DEFAULT_PROFILE,
+    levels=None,
+    frequencies=False,
+    min_layover=MIN_LAYOVER_S,
+    poll=POLL_S,
+    debounce=DEBOUNCE_S,
+):
+    """Build once, then rebuild on every settled change until interrupted."""
+    watcher = FeedWatcher(profile, levels, frequencies, min_layover)
+    snap, reload = snapshot(), False
+    print(f"watching {GEN_GTFS} and {SHAPES_DIR}/ (Ctrl-C to stop)", file=sys.stderr)
+    while True:
+        start = time.perf_counter()
+        try:
+            changed = watcher.rebuild(snap, reload)
+        except Exception:
+            # Half-saved files and typos are expected mid-edit; wait for the next
+            traceback.print_exc()
+            changed = None
+        elapsed = (time.perf_counter() - start) * 1000
+        if changed is None:
+            print(
+                f"build failed ({elapsed:.0f} ms), waiting for changes", file=sys.stderr
+            )
+        else:
+            print(
+                f"rebuilt {', '.join(changed) or 'nothing'} in {elapsed:.0f} ms",
+                file=sys.stderr,
+            )
+
+        while (latest := snapshot()) == snap:
+            time.sleep(poll)
+        latest = _settle(latest, debounce)
+        reload = latest.get(GEN_GTFS) != snap.get(GEN_GTFS)
+        snap = latest
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--compression", choices=PROFILES, default=DEFAULT_PROFILE)
+    parser.add_argument("--frequencies", action="store_true")
+    parser.add_argument(
+        "--min-layover", type=float, default=MIN_LAYOVER_S / 60, help="minutes"
+    )
+    args = parser.parse_args()
+    try:
+        watch(
+            args.compression,
+            frequencies=args.frequencies,
+            min_layover=round(args.min_layover * 60),
+        )
+    except KeyboardInterrupt:
+        pass